@@ -6,6 +6,7 @@ from django.db import IntegrityError
 from rest_framework.exceptions import MethodNotAllowed
 
 from common.utils.custom_exceptions import UserAlreadyExist
+from common.utils.db_errors import is_unique_violation
 from .models import User, Profile
 
 
@@ -59,7 +60,7 @@ class UserRegisterSerializer(RegisterSerializer):
         try:
             return super().save(request)
         except IntegrityError as e:
-            if str(e) == "UNIQUE constraint failed: accounts_user.email":
+            if is_unique_violation(e, User, "email"):
                 raise UserAlreadyExist
             raise e
 
@@ -1,13 +1,31 @@
 import uuid
+from decimal import Decimal
+
 from django.db import models
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db.models import Sum
+from django.db.models import DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
 
 from apps.products.models import Product
 
 
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        """annotate each cart with the number of items and the
+        subtotal of its items, so they are computed by the same query"""
+        return self.annotate(
+            items_quantity=Coalesce(Sum("items__quantity"), 0),
+            items_subtotal=Coalesce(
+                Sum(F("items__quantity") * F("items__product__price")),
+                Value(Decimal(0)),
+                output_field=DecimalField(max_digits=60, decimal_places=2),
+            ),
+        )
+
+
 class Cart(models.Model):
     """A user's cart"""
     id = models.UUIDField(
@@ -19,25 +37,40 @@ class Cart(models.Model):
     # Relationship
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="cart")
 
+    objects = CartQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Cart"
         verbose_name_plural = "Carts"
     
     def __str__(self):
         return f"[Cart] {self.user.first_name}'s cart"
-    
+
+    @cached_property
+    def totals(self):
+        """The number of items and subtotal of the cart, computed once per instance.
+        They are read from the `with_totals` annotations or the prefetched
+        items when available, else they are aggregated in one query"""
+        if hasattr(self, "items_subtotal"):
+            return self.items_quantity, self.items_subtotal
+        items = getattr(self, "_prefetched_objects_cache", {}).get("items")
+        if items is not None:
+            return sum(i.quantity for i in items), sum((i.subtotal for i in items), Decimal(0))
+        totals = self.items.aggregate(
+            total_quantity=Sum("quantity"), total_price=Sum(F("quantity") * F("product__price"))
+        )
+        return totals["total_quantity"] or 0, totals["total_price"] or Decimal(0)
+
     @property
     def no_of_items(self):
         """The total number of items in the user's cart"""
-        count = self.items.aggregate(total=Sum("quantity"))["total"] or 0
-        return count
+        return self.totals[0]
 
     @property
     def subtotal(self):
         """The total price of all items before discount is removed
         or any other additional charges is added."""
-        subtotal = sum([i.subtotal for i in self.items.all()])
-        return float(subtotal)
+        return float(self.totals[1])
     
     @property
     def discounts(self):
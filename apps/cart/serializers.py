@@ -21,6 +21,16 @@ def check_product_exists(validated_data):
     return None, None
 
 
+def check_product_available(product):
+    """raise a validation error if the product can not be added to a cart"""
+    if product.status == Product.ProductStatus.archived:
+        raise serializers.ValidationError("Product unavailable (Archived)")
+    if product.status == Product.ProductStatus.draft:
+        raise serializers.ValidationError("Can not order a product in draft")
+    if product.stock_quantity == 0 and not product.allow_backorder:
+        raise serializers.ValidationError("This product is out of stock")
+
+
 class CartItemSerializer(serializers.ModelSerializer):
     """cart Item serializier"""
 
@@ -49,12 +59,7 @@ class CartItemSerializer(serializers.ModelSerializer):
         return fields
 
     def validate_product(self, product):
-        if product.status == Product.ProductStatus.archived:
-            raise serializers.ValidationError("Product unavailable (Archived)")
-        if product.status == Product.ProductStatus.draft:
-            raise serializers.ValidationError("Can not order a product in draft")
-        if product.stock_quantity == 0 and not product.allow_backorder:
-            raise serializers.ValidationError("This product is out of stock")
+        check_product_available(product)
         return product
 
     def validate(self, validated_data):
@@ -112,6 +117,88 @@ class CartItemSerializer(serializers.ModelSerializer):
         return data
 
 
+class CartItemLineSerializer(serializers.Serializer):
+    """a line of `CartItemBulkSerializer`"""
+    product = serializers.UUIDField()
+    quantity = serializers.IntegerField(min_value=1, required=False)
+
+
+class CartItemBulkSerializer(serializers.Serializer):
+    """
+    Add or update many items of the user's cart at once. The products are
+    loaded (and locked) in one query and the items are inserted or updated
+    with a single upsert. Like with a single item, the quantity of a line
+    defaults to the quantity in the cart + 1, or the MOQ if the product is not
+    in the cart. Validation and saving must run in the same transaction, so
+    the stock and status of the products can not change in between.
+    """
+    items = CartItemLineSerializer(many=True, allow_empty=False, max_length=100)
+
+    def validate(self, validated_data):
+        lines = validated_data["items"]
+        product_ids = [line["product"] for line in lines]
+        if len(set(product_ids)) != len(product_ids):
+            raise serializers.ValidationError({
+                "items": "You cannot add the same product twice. Increase the quantity instead"
+            })
+
+        cart, _ = Cart.objects.get_or_create(user=self.context["request"].user)
+        products = {
+            product.pk: product
+            for product in Product.objects.select_for_update().filter(pk__in=product_ids).order_by("pk")
+        }
+        in_cart = dict(cart.items.filter(product_id__in=product_ids).values_list("product_id", "quantity"))
+
+        errors, has_errors = [], False
+        for line in lines:
+            product = products.get(line["product"])
+            try:
+                if product is None:
+                    raise serializers.ValidationError({"product": "Product not found"})
+                try:
+                    check_product_available(product)
+                except serializers.ValidationError as e:
+                    raise serializers.ValidationError({"product": e.detail})
+                quantity = line.get("quantity")
+                if not quantity:
+                    quantity = in_cart[product.pk] + 1 if product.pk in in_cart else product.min_order_quantity
+                if quantity < product.min_order_quantity:
+                    raise serializers.ValidationError({
+                        "quantity": f"Min order quantity (MOQ) for this product is {product.min_order_quantity}"
+                    })
+                if quantity > product.stock_quantity:
+                    raise serializers.ValidationError({"quantity": "Not enough stock to fufil order"})
+            except serializers.ValidationError as e:
+                errors.append(serializers.as_serializer_error(e))
+                has_errors = True
+                continue
+            line.update(product=product, quantity=quantity)
+            errors.append({})
+        if has_errors:
+            raise serializers.ValidationError({"items": errors})
+
+        validated_data["cart"] = cart
+        return validated_data
+
+    def create(self, validated_data):
+        cart, lines = validated_data["cart"], validated_data["items"]
+        items = [CartItem(cart=cart, product=line["product"], quantity=line["quantity"]) for line in lines]
+        CartItem.objects.bulk_create(
+            items,
+            update_conflicts=True,
+            unique_fields=["cart", "product"],
+            update_fields=["quantity", "updated_at"],
+        )
+        return list(
+            CartItem.objects.filter(cart=cart, product__in=[line["product"] for line in lines])
+            .select_related("product")
+            .prefetch_related(Product.prefetch_cover_image("product__images"))
+        )
+
+    def to_representation(self, instance):
+        return {"items": CartItemSerializer(instance, many=True).data}
+
+
 class CartSerializer(serializers.ModelSerializer):
     """Cart serializer. Read only"""
     items = CartItemSerializer(many=True, read_only=True)
@@ -1,3 +1,152 @@
-from django.test import TestCase
+import uuid
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse_lazy
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.products.models import Product, ProductImage
+from .models import Cart, CartItem
+
+
+@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+class CartTotalsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = User.objects.create_user(
+            email="testemail@gmail.com",
+            password="testpassword",
+            first_name="test",
+            last_name="user",
+        )
+        cls.cart = Cart.objects.create(user=cls.user)
+        for i in range(3):
+            product = Product.objects.create(
+                name=f"product {i}", description="description", price=100 * (i + 1), stock_quantity=10
+            )
+            CartItem.objects.create(cart=cls.cart, product=product, quantity=i + 1)
+            for position in (1, 2):
+                ProductImage.objects.create(
+                    product=product,
+                    image_url=f"https://img.test/{i}/{position}.png",
+                    position=i * 10 + position,
+                )
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_totals_computed_once(self):
+        with self.assertNumQueries(1):
+            cart = Cart.objects.with_totals().get(pk=self.cart.pk)
+            self.assertEqual(cart.no_of_items, 6)
+            self.assertEqual(cart.subtotal, 1400.0)
+            self.assertEqual(cart.total_amount, 1400.0)
+
+    def test_totals_without_annotations(self):
+        cart = Cart.objects.get(pk=self.cart.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual((cart.no_of_items, cart.subtotal, cart.total_amount), (6, 1400.0, 1400.0))
+
+    def test_cart_list(self):
+        url = reverse_lazy("cart-list")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["data"]["no_of_items"], 6)
+        self.assertEqual(response.data["data"]["subtotal"], 1400.0)
+        self.assertEqual(len(response.data["data"]["items"]), 3)
+
+    def test_cart_list_changes_when_item_removed(self):
+        url = reverse_lazy("cart-list")
+        response = self.client.get(url)
+        self.assertNotIn("Last-Modified", response)
+        etag = response["ETag"]
+        item = self.cart.items.first()
+        self.client.delete(reverse_lazy("cart-item-detail", kwargs={"pk": item.pk}))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["data"]["items"]), 2)
+
+    def test_cart_list_queries(self):
+        """the number of queries does not depend on the number of items"""
+        url = reverse_lazy("cart-list")
+        self.client.get(url)
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        items = response.data["data"]["items"]
+        self.assertEqual(
+            sorted(item["product"]["image"] for item in items),
+            [f"https://img.test/{i}/2.png" for i in range(3)],
+        )
+
+
+@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+class CartBulkTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = User.objects.create_user(
+            email="testemail@gmail.com",
+            password="testpassword",
+            first_name="test",
+            last_name="user",
+        )
+        cls.products = [
+            Product.objects.create(
+                name=f"product {i}", description="description", price=100, stock_quantity=10
+            )
+            for i in range(6)
+        ]
+        cls.cart = Cart.objects.create(user=cls.user)
+        CartItem.objects.create(cart=cls.cart, product=cls.products[0], quantity=2)
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse_lazy("cart-item-bulk")
+
+    def post(self, lines):
+        return self.client.post(self.url, {"items": lines}, format="json")
+
+    def test_add_and_update_items(self):
+        response = self.post([
+            {"product": self.products[0].pk, "quantity": 5},
+            {"product": self.products[1].pk, "quantity": 3},
+            {"product": self.products[2].pk},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["data"]["items"]), 3)
+        quantities = dict(self.cart.items.values_list("product_id", "quantity"))
+        self.assertEqual(quantities, {
+            self.products[0].pk: 5, self.products[1].pk: 3, self.products[2].pk: 1,
+        })
+
+        # without a quantity, the quantity in the cart is increased by 1
+        self.post([{"product": self.products[0].pk}])
+        self.assertEqual(self.cart.items.get(product=self.products[0]).quantity, 6)
+
+    def test_queries_do_not_grow_with_lines(self):
+        with CaptureQueriesContext(connection) as few:
+            self.post([{"product": product.pk, "quantity": 1} for product in self.products[:2]])
+        with self.assertNumQueries(len(few)):
+            response = self.post([{"product": product.pk, "quantity": 2} for product in self.products])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.cart.items.count(), 6)
+
+    def test_invalid_lines_change_nothing(self):
+        Product.objects.filter(pk=self.products[2].pk).update(status=Product.ProductStatus.archived)
+        response = self.post([
+            {"product": self.products[1].pk, "quantity": 1},
+            {"product": self.products[2].pk, "quantity": 1},
+            {"product": self.products[3].pk, "quantity": 11},
+            {"product": uuid.uuid4(), "quantity": 1},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.data["data"]["items"]
+        self.assertEqual(errors[0], {})
+        self.assertEqual(list(errors[1]), ["product"])
+        self.assertEqual(list(errors[2]), ["quantity"])
+        self.assertEqual(errors[3], {"product": ["Product not found"]})
+        self.assertEqual(self.cart.items.count(), 1)
@@ -10,6 +10,7 @@ CartViewSet = extend_schema_view(
 
 CartItemViewSet = extend_schema_view(
     create=extend_schema(tags=["Cart"]),
+    bulk=extend_schema(tags=["Cart"]),
     partial_update=extend_schema(tags=["Cart"]),
     destroy=extend_schema(tags=["Cart"])
 )(CartItemViewSet)
@@ -24,6 +25,11 @@ cart_item = CartItemViewSet.as_view({
     "post": "create"
 })
 
+# add or update many items
+cart_item_bulk = CartItemViewSet.as_view({
+    "post": "bulk"
+})
+
 # update and delete an item
 cart_item_detail = CartItemViewSet.as_view({
     "put": "update", "delete": "destroy"
@@ -32,5 +38,6 @@ cart_item_detail = CartItemViewSet.as_view({
 urlpatterns = [
     path("items/", cart_item_list, name="cart-list"),
     path("item/add/", cart_item, name="cart-item-add"),
+    path("items/bulk/", cart_item_bulk, name="cart-item-bulk"),
     path("item/<uuid:pk>/", cart_item_detail, name="cart-item-detail"),
 ]
@@ -1,11 +1,15 @@
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import status
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.response import Response
 
+from common.utils.conditional import conditional_response, queryset_validators
 from common.utils.responses import customize_response
 from apps.accounts.permissions import IsCartOwner
+from apps.products.models import Product
 from .models import Cart, CartItem
-from .serializers import CartSerializer, CartItemSerializer
+from .serializers import CartSerializer, CartItemSerializer, CartItemBulkSerializer
 
 
 class CartItemViewSet(ModelViewSet):
@@ -26,6 +30,21 @@ class CartItemViewSet(ModelViewSet):
     def update(self, request, *args, **kwargs):
         response = super().update(request, *args, **kwargs)
         return customize_response(response, "Item updated successfully.")
+
+    def bulk(self, request, *args, **kwargs):
+        """add or update many items at once (e.g to re-order a previous order).
+        The products are locked from validation until the items are saved"""
+        serializer = self.get_serializer(data=request.data)
+        with transaction.atomic():
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        response = Response(serializer.data, status=status.HTTP_201_CREATED)
+        return customize_response(response, "Items added successfully.")
+
+    def get_serializer_class(self):
+        if self.action == "bulk":
+            return CartItemBulkSerializer
+        return super().get_serializer_class()
     
     def destroy(self, request, *args, **kwargs):
         response = super().destroy(request, *args, **kwargs)
@@ -39,11 +58,35 @@ class CartViewSet(ModelViewSet):
     http_method_names = ["get", "delete"]
 
     def get_queryset(self):
-        """return the user's cart"""
-        cart, _ = self.queryset.get_or_create(user=self.request.user)
+        """return the user's cart, with its totals and items (and their
+        product and cover image) loaded in a fixed number of queries"""
+        items = CartItem.objects.select_related("product").prefetch_related(
+            Product.prefetch_cover_image("product__images")
+        )
+        cart = (
+            self.queryset.with_totals()
+            .prefetch_related(Prefetch("items", queryset=items))
+            .filter(user=self.request.user)
+            .first()
+        )
+        if cart is None:
+            cart, _ = self.queryset.get_or_create(user=self.request.user)
         return [cart]
     
     def list(self, request, *args, **kwargs):
+        """the cart changes when an item is added, updated or removed, or when
+        the product of an item changes (e.g its price). Only the ETag is sent,
+        it counts the items, so it also changes when an item is removed"""
+        etag, _ = queryset_validators(
+            CartItem.objects.filter(cart__user=request.user),
+            fields=("updated_at", "product__updated_at", "cart__updated_at"),
+            extra=[request.user.pk],
+        )
+        return conditional_response(
+            request, lambda: self._list(request, *args, **kwargs), etag, private=True
+        )
+
+    def _list(self, request, *args, **kwargs):
         response = super().list(request, *args, **kwargs)
         if response.data is not None:
             response.data = response.data[0] # get the first cart which is the user's cart
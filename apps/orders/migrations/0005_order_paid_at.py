@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:05
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def set_paid_at(apps, schema_editor):
+    """set the paid date of the orders already paid to the date
+    their paid payment was last updated"""
+    Order = apps.get_model("orders", "Order")
+    Payment = apps.get_model("payments", "Payment")
+    paid_at = (
+        Payment.objects.filter(order=OuterRef("pk"), payment_status="paid")
+        .values("order").annotate(paid_at=Max("updated_at")).values("paid_at")
+    )
+    Order.objects.filter(payments__payment_status="paid").update(paid_at=Subquery(paid_at))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_order_total_quantity_alter_order_status'),
+        ('payments', '0003_alter_payment_options_payment_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='paid_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the payment of the order was confirmed', null=True),
+        ),
+        migrations.RunPython(set_paid_at, migrations.RunPython.noop),
+    ]
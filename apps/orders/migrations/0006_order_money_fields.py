@@ -0,0 +1,65 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:07
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    """existing order items are priced at the current product price,
+    and orders get the total of their items (no discounts or fees)"""
+    Order = apps.get_model("orders", "Order")
+    OrderItem = apps.get_model("orders", "OrderItem")
+    Product = apps.get_model("products", "Product")
+
+    OrderItem.objects.update(
+        unit_price=Subquery(Product.objects.filter(pk=OuterRef("product_id")).values("price")[:1])
+    )
+    money = DecimalField(max_digits=50, decimal_places=2)
+    subtotal = (
+        OrderItem.objects.filter(order=OuterRef("pk")).values("order")
+        .annotate(total=Sum(F("unit_price") * F("quantity"), output_field=money)).values("total")
+    )
+    Order.objects.update(subtotal=Coalesce(Subquery(subtotal), 0, output_field=money))
+    Order.objects.update(total_amount=F("subtotal"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_order_paid_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='delivery_fee',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=50),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='discounts',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='The total deduction from the original item price resulting from application of discount, sale price, etc', max_digits=50),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='other_fees',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='Taxes, service fee, etc', max_digits=50),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='The total price of all items before discount is removed or any other additional charges is added', max_digits=50),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='Final price the customer will pay after discount has been removed and all fees have been added', max_digits=50),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='The price of the product when the order was placed', max_digits=50),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
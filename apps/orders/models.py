@@ -10,6 +10,7 @@ from apps.products.models import Product
 from apps.discounts.models import Discounts
 from common.utils.generate_unique_id import generate_unique_id
 from common.utils.custom_exceptions import UniqueOrderNumberError
+from common.utils.db_errors import is_unique_violation
 
 
 class Order(models.Model):
@@ -43,6 +44,26 @@ class Order(models.Model):
     """
     # delivery_option # pick up from our store in your location. delivery fee will be removed
     notes = models.TextField(blank=True)
+    subtotal = models.DecimalField(
+        max_digits=50, decimal_places=2, default=0, editable=False,
+        help_text="The total price of all items before discount is removed or any other additional charges is added"
+    )
+    discounts = models.DecimalField(
+        max_digits=50, decimal_places=2, default=0, editable=False,
+        help_text="The total deduction from the original item price resulting from application of discount, sale price, etc"
+    )
+    delivery_fee = models.DecimalField(max_digits=50, decimal_places=2, default=0, editable=False)
+    other_fees = models.DecimalField(
+        max_digits=50, decimal_places=2, default=0, editable=False, help_text="Taxes, service fee, etc"
+    )
+    total_amount = models.DecimalField(
+        max_digits=50, decimal_places=2, default=0, editable=False,
+        help_text="Final price the customer will pay after discount has been removed and all fees have been added"
+    )
+    """the money fields are set once, when the order is placed (see `set_totals`)"""
+    paid_at = models.DateTimeField(
+        null=True, blank=True, editable=False, help_text="When the payment of the order was confirmed"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -71,12 +92,13 @@ class Order(models.Model):
                     with transaction.atomic():
                         return super().save(*args, **kwargs)
                 except IntegrityError as e:
-                    if str(e) == "UNIQUE constraint failed: orders_order.order_number":
-                        self.order_number = generate_unique_id()
+                    if not is_unique_violation(e, Order, "order_number"):
+                        raise e
+                    self.order_number = generate_unique_id()
             """retry the 5th time"""
             return super().save(*args, **kwargs)
         except IntegrityError as e:
-            if str(e) == "UNIQUE constraint failed: orders_order.order_number":
+            if is_unique_violation(e, Order, "order_number"):
                 raise UniqueOrderNumberError
             raise e
     
@@ -86,43 +108,39 @@ class Order(models.Model):
         count = self.items.aggregate(total=Sum("quantity"))["total"] or 0
         return count
 
-    @property
-    def subtotal(self):
-        """The total price of all items before discount is removed
-        or any other additional charges is added."""
-        subtotal = sum([i.subtotal for i in self.items.all()])
-        return float(subtotal)
-
-    @property
-    def discounts(self):
+    def set_totals(self, items):
+        """Compute the money fields of the order from its items (with their
+        unit price set). They are stored when the order is placed, so later
+        changes to product prices, discounts or fees do not change it."""
+        self.subtotal = sum((item.subtotal for item in items), Decimal(0))
+        self.discounts = self.calculate_discounts()
+        self.delivery_fee = self.calculate_delivery_fee()
+        self.other_fees = self.calculate_other_fees()
+        self.total_amount = (self.subtotal - self.discounts) + self.delivery_fee + self.other_fees
+
+    def calculate_discounts(self):
         """Get the total deduction from the original item price
         resulting from application of discount, sale price, etc"""
-        return 0.00
+        return Decimal(0)
 
-    @property
-    def delivery_fee(self):
+    def calculate_delivery_fee(self):
         """Get the delivery/shipping fee for the order based on the user's location"""
-        return 0.00
+        return Decimal(0)
 
-    @property
-    def other_fees(self):
+    def calculate_other_fees(self):
         """Place logic for other fees here. Includes taxes, service fee, etc
         Implement this if you need to use it.
         """
-        return 0.00
-
-    @property
-    def total_amount(self):
-        """Final price the customer will pay after discount has
-        been removed and all fees have been added"""
-        return round(float(
-            (self.subtotal - self.discounts) + self.delivery_fee + self.other_fees), 2)
+        return Decimal(0)
 
     @property
     def payment_status(self):
-        """Easily check the payment status from the model"""
+        """Easily check the payment status from the model. The status of
+        the latest payment can be annotated as `latest_payment_status`"""
+        if hasattr(self, "latest_payment_status"):
+            return self.latest_payment_status
         payment = self.payments.first()
-        return payment.payment_status
+        return payment.payment_status if payment else None
     
     @property
     def delivery_status(self):
@@ -138,6 +156,10 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField(
         validators=[MinValueValidator(1)]
     )
+    unit_price = models.DecimalField(
+        max_digits=50, decimal_places=2, default=0, editable=False,
+        help_text="The price of the product when the order was placed"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -195,7 +217,7 @@ class OrderItem(models.Model):
     def subtotal(self):
         """Total amount before any discount is removed or any fee is added.
         the unit amount x the quantity"""
-        return self.product.price*self.quantity
+        return self.unit_price*self.quantity
 
     @property
     def discounted_amount(self):
@@ -5,8 +5,8 @@ from django.db import transaction
 
 from apps.products.serializers import MinimalProductSerializer
 from apps.discounts.models import Discounts
+from apps.products.cache import invalidate_products
 from apps.products.models import Product
-from common.services.payment_service import initialize_payment
 
 from .models import Order, OrderItem
 
@@ -20,6 +20,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
     order = serializers.SlugRelatedField(
         slug_field="order_number", read_only=True
     )
+    unit_price = serializers.FloatField(read_only=True)
 
     class Meta:
         model = OrderItem
@@ -27,6 +28,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
             "id",
             "quantity",
             "product",
+            "unit_price",
             "applied_discount",
             "order",
             "subtotal",
@@ -74,6 +76,12 @@ class OrderItemSerializer(serializers.ModelSerializer):
 class OrderSerializer(serializers.ModelSerializer):
     """Order serializer"""
     items = OrderItemSerializer(many=True)
+    # money fields are represented as numbers
+    subtotal = serializers.FloatField(read_only=True)
+    discounts = serializers.FloatField(read_only=True)
+    delivery_fee = serializers.FloatField(read_only=True)
+    other_fees = serializers.FloatField(read_only=True)
+    total_amount = serializers.FloatField(read_only=True)
     applied_discount = serializers.SlugRelatedField(
         slug_field="code", queryset=Discounts.objects.all(), required=False
     )
@@ -95,6 +103,7 @@ class OrderSerializer(serializers.ModelSerializer):
             "other_fees",
             "total_amount",
             "payment_status",
+            "paid_at",
             "delivery_status",
             "delivery_address_line1",
             "delivery_address_line2",
@@ -115,6 +124,7 @@ class OrderSerializer(serializers.ModelSerializer):
             "other_fees",
             "total_amount",
             "payment_status",
+            "paid_at",
             "delivery_status",
             "created_at",
             "updated_at",
@@ -138,23 +148,45 @@ class OrderSerializer(serializers.ModelSerializer):
         """create an order"""
         order_items = validated_data.pop("items")
 
-        order = Order.objects.create(**validated_data)
-        added_products = {}
-        total_quantity = 0
+        quantities = {}
         for item in order_items:
             """ensure product is unique in Order"""
-            if added_products.get(item["product"].id, None):
+            if item["product"].id in quantities:
                 raise serializers.ValidationError("You cannot add the same product twice. Increase the quantity instead")
-            OrderItem.objects.create(order=order, **item)
-            total_quantity += item["quantity"]
-            added_products[item["product"].id] = True
-            """reduce the stock quantity from the existing stock
-            and increase product purchase count"""
-            product: Product = item["product"]
-            product.stock_quantity -= item["quantity"]
-            product.purchase_count += item["quantity"]
-            product.save(update_fields=["stock_quantity", "purchase_count"])
-
-        order.total_quantity = total_quantity
-        order.save(update_fields=["total_quantity"])
+            quantities[item["product"].id] = item["quantity"]
+
+        """reduce the stock quantity from the existing stock
+        and increase product purchase count"""
+        unavailable = Product.decrement_stock(quantities)
+        if unavailable:
+            products = {item["product"].id: item["product"] for item in order_items}
+            raise serializers.ValidationError({
+                "items": [f"Not enough stock of {products[pk].name} to fufil order" for pk in unavailable]
+            })
+        invalidate_products(quantities)
+
+        order = Order(**validated_data, total_quantity=sum(quantities.values()))
+        items = [OrderItem(order=order, unit_price=item["product"].price, **item) for item in order_items]
+        order.set_totals(items)
+        order.save()
+        OrderItem.objects.bulk_create(items)
         return order
+
+
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """A compact read only view of an order, without its items"""
+    total_amount = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Order
+        fields = [
+            "id",
+            "order_number",
+            "status",
+            "total_quantity",
+            "total_amount",
+            "payment_status",
+            "paid_at",
+            "created_at",
+        ]
+        read_only_fields = fields.copy()
@@ -1,3 +1,270 @@
-from django.test import TestCase
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, OperationalError, connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse_lazy
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.payments.models import Payment
+from apps.products.models import Product
+from common.utils.custom_exceptions import ServiceUnavailable, UniqueOrderNumberError
+from common.utils.db_errors import is_unique_violation, unique_violation
+from common.utils.generate_unique_id import EPOCH, OrderNumberAllocator
+from .models import Order, OrderItem
+from .serializers import OrderSerializer
+
+
+ADDRESS = {
+    "delivery_address_line1": "1 test street",
+    "delivery_address_closest_busstop": "test busstop",
+    "delivery_address_city": "test city",
+    "delivery_address_state": "test state",
+    "delivery_address_country": "test country",
+}
+
+
+def place_order(user, items):
+    """create an order with the serializer, as the order view does"""
+    request = SimpleNamespace(user=user, method="POST")
+    data = {"items": [{"product": product.pk, "quantity": quantity} for product, quantity in items]}
+    serializer = OrderSerializer(data={**data, **ADDRESS}, context={"request": request})
+    serializer.is_valid(raise_exception=True)
+    return serializer.save()
+
+
+def create_user(email):
+    return User.objects.create_user(
+        email=email, password="testpassword", first_name="test", last_name="user"
+    )
+
+
+@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+class OrderStockTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = create_user("testemail@gmail.com")
+        cls.shoe = Product.objects.create(name="shoe", description="shoe", price=100, stock_quantity=5)
+        cls.bag = Product.objects.create(name="bag", description="bag", price=50, stock_quantity=2)
+
+    def test_order_takes_stock(self):
+        order = place_order(self.user, [(self.shoe, 2), (self.bag, 1)])
+        self.assertEqual(order.total_quantity, 3)
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 2)
+        self.assertEqual((order.subtotal, order.total_amount), (250, 250))
+        self.shoe.refresh_from_db()
+        self.bag.refresh_from_db()
+        self.assertEqual((self.shoe.stock_quantity, self.shoe.purchase_count), (3, 2))
+        self.assertEqual((self.bag.stock_quantity, self.bag.purchase_count), (1, 1))
+
+    def test_totals_kept_after_price_change(self):
+        order = place_order(self.user, [(self.shoe, 2)])
+        Product.objects.filter(pk=self.shoe.pk).update(price=500)
+        order = Order.objects.get(pk=order.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(order.total_amount, 200)
+        data = OrderSerializer(Order.objects.prefetch_related("items", "payments").get(pk=order.pk)).data
+        self.assertEqual(data["total_amount"], 200.0)
+        self.assertEqual(data["items"][0]["unit_price"], 100.0)
+
+    def test_not_enough_stock_takes_nothing(self):
+        self.assertEqual(Product.decrement_stock({self.shoe.pk: 1, self.bag.pk: 3}), [self.bag.pk])
+        self.shoe.refresh_from_db()
+        self.assertEqual(self.shoe.stock_quantity, 5)
+        self.assertEqual(Order.objects.count(), 0)
+
+
+class OrderNumberAllocatorTest(TestCase):
+    @mock.patch("common.utils.generate_unique_id.time.time", return_value=1760000000)
+    def test_unique_within_a_second(self, _):
+        allocator = OrderNumberAllocator(host_id=1)
+        numbers = [allocator.allocate() for _ in range(3000)]
+        self.assertEqual(len(set(numbers)), 3000)
+        self.assertLessEqual(max(map(len, numbers)), Order._meta.get_field("order_number").max_length)
+        # the sequence overflowed twice, the next numbers are taken from the following seconds
+        self.assertEqual(allocator.last_second, 1760000000 - EPOCH + 2)
+
+    @mock.patch("common.utils.generate_unique_id.time.time", return_value=1760000000)
+    def test_processes_do_not_collide(self, _):
+        first, second = OrderNumberAllocator(host_id=1), OrderNumberAllocator(host_id=1)
+        with mock.patch("common.utils.generate_unique_id.os.getpid", return_value=4242):
+            second.reset()
+        self.assertNotEqual(first.allocate(), second.allocate())
+
+
+@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+class OrderNumberCollisionTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = create_user("testemail@gmail.com")
+
+    def create_order(self):
+        return Order.objects.create(customer=self.user, **ADDRESS)
+
+    def test_retry_on_collision(self):
+        taken = self.create_order().order_number
+        with mock.patch("apps.orders.models.generate_unique_id", side_effect=[taken, taken, "NEW1"]):
+            self.assertEqual(self.create_order().order_number, "NEW1")
+
+    def test_gives_up_after_retries(self):
+        taken = self.create_order().order_number
+        with mock.patch("apps.orders.models.generate_unique_id", return_value=taken):
+            with self.assertRaises(UniqueOrderNumberError):
+                self.create_order()
+
+    def test_classify_backend_errors(self):
+        def integrity_error(cause):
+            error = IntegrityError(str(cause))
+            error.__cause__ = cause
+            return error
+
+        class PostgresError(Exception):
+            sqlstate = "23505"
+            diag = SimpleNamespace(
+                constraint_name="orders_order_order_number_key",
+                message_detail="Key (order_number)=(ABCD) already exists.",
+            )
+
+        mysql_error = Exception(1062, "Duplicate entry 'ABCD' for key 'orders_order.order_number'")
+        sqlite_error = Exception("UNIQUE constraint failed: orders_order.order_number")
+        for cause in (PostgresError(), mysql_error, sqlite_error):
+            self.assertTrue(is_unique_violation(integrity_error(cause), Order, "order_number"))
+            self.assertFalse(is_unique_violation(integrity_error(cause), Order, "id"))
+            self.assertFalse(is_unique_violation(integrity_error(cause), User, "email"))
+
+        PostgresError.sqlstate = "23503" # foreign key violation
+        self.assertIsNone(unique_violation(integrity_error(PostgresError())))
+        self.assertIsNone(unique_violation(integrity_error(Exception("NOT NULL constraint failed: x.y"))))
+
+
+@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+class OrderPaymentInitTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = create_user("testemail@gmail.com")
+        cls.shoe = Product.objects.create(name="shoe", description="shoe", price=100, stock_quantity=5)
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.data = {"items": [{"product": self.shoe.pk, "quantity": 1}], **ADDRESS}
+
+    @mock.patch("apps.orders.views.initialize_payment", side_effect=ServiceUnavailable)
+    def test_order_kept_when_payment_init_fails(self, init):
+        with self.assertLogs("apps.orders.views", "ERROR"):
+            response = self.client.post(reverse_lazy("order-list"), self.data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        order = Order.objects.get(pk=response.data["data"]["order_id"])
+        self.assertEqual(order.items.count(), 1)
+
+        def init_payment(data):
+            Payment.objects.create(reference="ref", order_id=data["order_id"], amount=data["amount"])
+            return {"status": True, "data": {"reference": "ref"}}
+
+        init.side_effect = init_payment
+        url = reverse_lazy("order-payment", kwargs={"pk": order.pk})
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["data"]["payment_data"], {"reference": "ref"})
+        self.assertEqual(init.call_args.args[0]["order_id"], order.id)
+
+        # a payment is only initialized once, the order is checked under the lock
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(init.call_count, 2)
+
+    @mock.patch("apps.orders.views.initialize_payment")
+    def test_payment_init_locked(self, init):
+        order = place_order(self.user, [(self.shoe, 1)])
+        lock_cache = caches[settings.LOCK_CACHE_ALIAS]
+        lock_cache.add(f"orders:payment-init:{order.pk}", True)
+        try:
+            response = self.client.post(reverse_lazy("order-payment", kwargs={"pk": order.pk}))
+        finally:
+            lock_cache.delete(f"orders:payment-init:{order.pk}")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        init.assert_not_called()
+
+
+@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+class OrderListTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = create_user("testemail@gmail.com")
+        cls.shoe = Product.objects.create(name="shoe", description="shoe", price=100, stock_quantity=50)
+        cls.bag = Product.objects.create(name="bag", description="bag", price=50, stock_quantity=50)
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def place_orders(self, count):
+        for _ in range(count):
+            order = place_order(self.user, [(self.shoe, 1), (self.bag, 2)])
+            Payment.objects.create(reference=f"ref-{order.pk}", order=order, amount=order.total_amount)
+
+    def test_queries_do_not_grow_with_orders(self):
+        self.place_orders(2)
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(reverse_lazy("order-list"))
+        self.assertEqual(len(response.data["data"]["results"]), 2)
+
+        self.place_orders(5)
+        with self.assertNumQueries(len(few)):
+            response = self.client.get(reverse_lazy("order-list"))
+        orders = response.data["data"]["results"]
+        self.assertEqual(len(orders), 7)
+        self.assertEqual(len(orders[0]["items"]), 2)
+        self.assertEqual(orders[0]["payment_status"], Payment.PaymentStatus.PENDING)
+
+    def test_latest_payment_status(self):
+        self.place_orders(1)
+        order = Order.objects.get()
+        Payment.objects.create(
+            reference="ref-latest", order=order, amount=order.total_amount,
+            payment_status=Payment.PaymentStatus.PAID,
+        )
+        response = self.client.get(reverse_lazy("order-detail", kwargs={"pk": order.pk}))
+        self.assertEqual(response.data["data"]["payment_status"], Payment.PaymentStatus.PAID)
+
+
+@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+class ConcurrentOrderTest(TransactionTestCase):
+    def test_no_oversell(self):
+        stock, buyers = 5, 12
+        product = Product.objects.create(
+            name="limited", description="limited", price=100, stock_quantity=stock
+        )
+        users = [create_user(f"buyer{i}@test.com") for i in range(buyers)]
+
+        def buy(user):
+            """place an order, retrying while the database is locked (sqlite)"""
+            try:
+                for _ in range(100):
+                    try:
+                        place_order(user, [(product, 1)])
+                        return True
+                    except ValidationError:
+                        return False
+                    except OperationalError:
+                        time.sleep(0.01)
+                return False
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=buyers) as executor:
+            results = list(executor.map(buy, users))
+
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 0)
+        self.assertEqual(results.count(True), stock)
+        self.assertEqual(Order.objects.count(), results.count(True))
+        self.assertEqual(product.purchase_count, results.count(True))
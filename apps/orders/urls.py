@@ -8,6 +8,7 @@ OrderViewSet = extend_schema_view(
     create=extend_schema(tags=["Orders"]),
     retrieve=extend_schema(tags=["Orders"]),
     destroy=extend_schema(tags=["Orders"]),
+    payment=extend_schema(tags=["Orders"], request=None),
 )(OrderViewSet)
 
 order_list_create = OrderViewSet.as_view({
@@ -18,7 +19,12 @@ order_detail = OrderViewSet.as_view({
     "get": "retrieve"
 })
 
+order_payment = OrderViewSet.as_view({
+    "post": "payment"
+})
+
 urlpatterns = [
     path("", order_list_create, name="order-list"),
-    path("<uuid:pk>/", order_detail, name="order-detail")
+    path("<uuid:pk>/", order_detail, name="order-detail"),
+    path("<uuid:pk>/payment/", order_payment, name="order-payment"),
 ]
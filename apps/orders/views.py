@@ -1,38 +1,110 @@
-from django.db import transaction
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import OuterRef, Prefetch, Subquery
+from rest_framework.exceptions import APIException
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 
-from common.utils.responses import customize_response, success_response
+from common.utils.conditional import conditional_response, queryset_validators
+from common.utils.custom_exceptions import PaymentAlreadyInitialized, PaymentInProgress
+from common.utils.pagination import CreatedAtCursorPagination
+from common.utils.responses import customize_response, error_response, success_response
 from common.services.payment_service import initialize_payment
+from apps.payments.models import Payment
 from .models import Order, OrderItem
 from .serializers import OrderSerializer, OrderItemSerializer
 
+logger = logging.getLogger(__name__)
+
+PAYMENT_INIT_LOCK_TIMEOUT = 60
+"""how long (in seconds) a payment initialization blocks another one for the same order"""
+
 
 class OrderViewSet(ModelViewSet):
     serializer_class = OrderSerializer
     queryset = Order.objects.all()
     permission_classes = [IsAuthenticated]
     http_method_names = ["get", "post", "delete"]
+    pagination_class = CreatedAtCursorPagination
 
     def get_queryset(self):
-        """the user can only see their Orders"""
-        return self.queryset.filter(customer=self.request.user)
+        """the user can only see their Orders. Orders are read with their items
+        and the status of their latest payment in a fixed number of queries"""
+        queryset = self.queryset.filter(customer=self.request.user)
+        if self.action in ("list", "retrieve"):
+            latest_payment = Payment.objects.filter(order=OuterRef("pk")).order_by("-created_at")
+            queryset = (
+                queryset.select_related("applied_discount")
+                .prefetch_related(
+                    Prefetch("items", queryset=OrderItem.objects.select_related("applied_discount"))
+                )
+                .annotate(latest_payment_status=Subquery(latest_payment.values("payment_status")[:1]))
+            )
+        return queryset
+
+    def get_validators(self, queryset):
+        """an order changes when it is updated or when one of its payments is"""
+        return queryset_validators(
+            queryset,
+            fields=("updated_at", "payments__updated_at"),
+            extra=[self.request.user.pk, self.request.get_full_path()],
+        )
 
     def list(self, request, *args, **kwargs):
+        """only the ETag is sent, a deleted order does not change the
+        latest update date of the list"""
+        etag, _ = self.get_validators(self.queryset.filter(customer=request.user))
+        return conditional_response(
+            request, lambda: self._list(request, *args, **kwargs), etag, private=True
+        )
+
+    def _list(self, request, *args, **kwargs):
         response = super().list(request, *args, **kwargs)
         return customize_response(response, "Orders retrieved successfully.")
 
     def retrieve(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(
+            self.queryset.filter(customer=request.user, pk=kwargs[self.lookup_field])
+        )
+        return conditional_response(
+            request, lambda: self._retrieve(request, *args, **kwargs), etag, last_modified, private=True
+        )
+
+    def _retrieve(self, request, *args, **kwargs):
         response = super().retrieve(request, *args, **kwargs)
         return customize_response(response, "Order retrieved successfully.")
 
-    @transaction.atomic()
+    def initialize_payment(self, order: Order):
+        """Initialize the payment of an order with the payment gateway.
+        This is only called once the order is committed, so the db transaction
+        (and the product rows it locked) is never held open while waiting for
+        the gateway. Concurrent calls for the same order are rejected by a lock
+        in the `LOCK_CACHE_ALIAS` cache, held until the payment is saved, and
+        the order is checked for a payment once the lock is taken"""
+        cache = caches[settings.LOCK_CACHE_ALIAS]
+        lock_key = f"orders:payment-init:{order.pk}"
+        if not cache.add(lock_key, True, timeout=PAYMENT_INIT_LOCK_TIMEOUT):
+            raise PaymentInProgress
+        try:
+            if order.payments.exists():
+                raise PaymentAlreadyInitialized
+            payment_data = {
+                "email": order.customer.email,
+                "amount": float(order.total_amount),
+                "order_id": order.id
+            }
+            return initialize_payment(payment_data) # the payment is saved (committed) on return
+        finally:
+            cache.delete(lock_key)
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        order = serializer.save()
+        order = serializer.save() # committed by the serializer
 
         if (order.total_amount <= 0):
             """for orders with 0 fees and 0 prices"""
@@ -42,12 +114,16 @@ class OrderViewSet(ModelViewSet):
                 status_code=status.HTTP_201_CREATED)
 
         # create payment after creating order
-        payment_data = {
-            "email": order.customer.email,
-            "amount": order.total_amount,
-            "order_id": order.id
-        }
-        payment_res = initialize_payment(payment_data)
+        try:
+            payment_res = self.initialize_payment(order)
+        except APIException as e:
+            """the order is kept, its payment can be initialized again
+            with the order payment endpoint"""
+            logger.error("Payment initialization failed for order %s: %s", order.id, e)
+            response = Response({"order_id": order.id}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            return customize_response(
+                response, "Order created but payment could not be initialized. Retry the order payment."
+            )
         res_data = {
             "order_id": order.id,
             "payment_data": payment_res["data"]
@@ -57,3 +133,15 @@ class OrderViewSet(ModelViewSet):
         response = Response(res_data, status=status.HTTP_201_CREATED, headers=headers)
         return customize_response(response, "Order created successfully.")
 
+    def payment(self, request, *args, **kwargs):
+        """Initialize the payment of an order that has none, e.g when
+        the payment gateway was unavailable when the order was created"""
+        order: Order = self.get_object()
+        if order.total_amount <= 0:
+            return error_response("NoPaymentRequired: Order has nothing to pay", status.HTTP_400_BAD_REQUEST)
+        payment_res = self.initialize_payment(order)
+        res_data = {
+            "order_id": order.id,
+            "payment_data": payment_res["data"]
+        }
+        return success_response(res_data, "Payment initialized successfully.", status_code=status.HTTP_201_CREATED)
@@ -1,5 +1,12 @@
 from django.contrib import admin
 
-from .models import Payment
+from .models import Payment, WebhookEvent
 
 admin.site.register(Payment)
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ("event", "reference", "status", "attempts", "created_at", "processed_at")
+    list_filter = ("status", "event")
+    search_fields = ("reference",)
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from common.services.fake_paystack import FakePaystackServer
+
+
+class Command(BaseCommand):
+    help = ("Run a local fake Paystack API to test or benchmark the payment flow offline. "
+            "Start the app with PAYSTACK_BASE_URL set to the server url, and add 127.0.0.1 "
+            "to PAYSTACK_EXTRA_WEBHOOK_IPS to accept its webhooks")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument(
+            "--latency", type=float, default=0.0, help="Seconds added to every request"
+        )
+        parser.add_argument(
+            "--jitter", type=float, default=0.0, help="Max random seconds added to the latency"
+        )
+        parser.add_argument(
+            "--error-rate", type=float, default=0.0, help="Fraction of the requests failing with a 500"
+        )
+        parser.add_argument(
+            "--timeout-rate", type=float, default=0.0, help="Fraction of the requests that hang"
+        )
+        parser.add_argument(
+            "--hang", type=float, default=30.0, help="How long (in seconds) a hanging request hangs"
+        )
+        parser.add_argument(
+            "--pay-after", type=float, default=None,
+            help="Mark transactions as paid this many seconds after they are initialized"
+        )
+        parser.add_argument(
+            "--webhook-url", default=None,
+            help="Where to send the charge.success webhooks, e.g http://127.0.0.1:8000/api/v1/payments/webhook/"
+        )
+        parser.add_argument("--seed", type=int, default=None, help="Seed of the simulated failures")
+
+    def handle(self, *args, **options):
+        server = FakePaystackServer(
+            address=(options["host"], options["port"]),
+            secret_key=settings.PAYSTACK_KEY or "",
+            latency=options["latency"],
+            jitter=options["jitter"],
+            error_rate=options["error_rate"],
+            timeout_rate=options["timeout_rate"],
+            hang=options["hang"],
+            pay_after=options["pay_after"],
+            webhook_url=options["webhook_url"],
+            seed=options["seed"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Fake Paystack running on {server.url}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"{len(server.transactions)} transaction(s), {server.webhooks_sent} webhook(s) sent.")
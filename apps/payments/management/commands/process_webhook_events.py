@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.payments.webhooks import process_events
+
+
+class Command(BaseCommand):
+    help = "Process the webhook events received from the payment gateway, in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=100,
+            help="Number of events processed per batch. Defaults to 100"
+        )
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Keep processing new events instead of exiting once there are none left"
+        )
+        parser.add_argument(
+            "--interval", type=float, default=1.0,
+            help="Seconds to wait for new events when there are none (with --loop). Defaults to 1"
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                count = process_events(batch_size=options["batch_size"])
+                total += count
+                if not count:
+                    if not options["loop"]:
+                        break
+                    time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} event(s)."))
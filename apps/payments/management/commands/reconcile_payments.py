@@ -0,0 +1,44 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from apps.payments.reconciliation import reconcile_payments
+
+
+class Command(BaseCommand):
+    help = "Verify the pending payments with the payment gateway and save their status"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=200,
+            help="Number of payments loaded and saved at a time. Defaults to 200"
+        )
+        parser.add_argument(
+            "--workers", type=int, default=8,
+            help="Number of concurrent requests to the gateway. Defaults to 8"
+        )
+        parser.add_argument(
+            "--rate", type=float, default=20.0,
+            help="Max requests per second to the gateway (0 for no limit). Defaults to 20"
+        )
+        parser.add_argument(
+            "--min-age", type=int, default=5,
+            help="Only verify payments pending for at least this many minutes. Defaults to 5"
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        counts = reconcile_payments(
+            chunk_size=options["chunk_size"],
+            workers=options["workers"],
+            rate=options["rate"],
+            min_age=timedelta(minutes=options["min_age"]),
+        )
+        elapsed = time.perf_counter() - start
+        total = sum(counts.values())
+        for status, count in sorted(counts.items()):
+            self.stdout.write(f"{status}: {count}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {total} payment(s) in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.1f}/s)."
+        ))
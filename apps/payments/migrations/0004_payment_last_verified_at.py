@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_alter_payment_options_payment_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='last_verified_at',
+            field=models.DateTimeField(blank=True, help_text='When the payment was last verified with the payment gateway', null=True),
+        ),
+    ]
@@ -1,11 +1,64 @@
 import uuid
-from django.db import models
+from datetime import timedelta
+
+from django.db import models, transaction
 from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
 from django.core.validators import MinValueValidator
 
 from apps.orders.models import Order
 from common.services.payment_service import verify_payment
 
+VERIFY_LOCK_TIMEOUT = 60
+"""how long (in seconds) a verification blocks another one of the same payment"""
+
+
+class PaymentQuerySet(models.QuerySet):
+    def mark_paid(self):
+        """
+        Mark the payments as paid (and verified) and set the paid date of
+        their orders, in a transaction. Payments already paid or refunded are
+        not written again, so applying the same payment confirmation more
+        than once (e.g duplicate webhooks) costs a single UPDATE matching no
+        row. Returns the number of payments that changed.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            changed = self.exclude(payment_status=Payment.PaymentStatus.REFUNDED).exclude(
+                payment_status=Payment.PaymentStatus.PAID, verified=True
+            )
+            count = changed.update(
+                payment_status=Payment.PaymentStatus.PAID, verified=True, updated_at=now
+            )
+            if count:
+                Order.objects.filter(
+                    paid_at__isnull=True,
+                    pk__in=self.filter(payment_status=Payment.PaymentStatus.PAID).values("order_id"),
+                ).update(paid_at=now, updated_at=now)
+        return count
+
+    def apply_status(self, payment_status):
+        """
+        Apply a status verified with the payment gateway, with conditional
+        updates, so a payment never goes back to an earlier status (e.g a
+        payment marked as paid by a webhook while it was being verified is
+        not cancelled). A payment can be refunded once paid and cancelled
+        while pending. Returns the number of payments that changed.
+        """
+        now = timezone.now()
+        if payment_status == Payment.PaymentStatus.PAID:
+            return self.mark_paid()
+        if payment_status == Payment.PaymentStatus.REFUNDED:
+            return self.exclude(payment_status=Payment.PaymentStatus.REFUNDED).update(
+                payment_status=payment_status, verified=True, updated_at=now
+            )
+        if payment_status == Payment.PaymentStatus.CANCELLED:
+            return self.filter(payment_status=Payment.PaymentStatus.PENDING).update(
+                payment_status=payment_status, verified=True, updated_at=now
+            )
+        return 0
+
 
 class Payment(models.Model):
     """manage payments"""
@@ -27,6 +80,9 @@ class Payment(models.Model):
         help_text="The status of the payment"
     )
     verified = models.BooleanField(default=False)
+    last_verified_at = models.DateTimeField(
+        null=True, blank=True, help_text="When the payment was last verified with the payment gateway"
+    )
     currency = models.CharField(max_length=5)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -34,6 +90,8 @@ class Payment(models.Model):
     # Relationship
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="payments")
 
+    objects = PaymentQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Payment"
         verbose_name_plural = "Payments"
@@ -41,24 +99,150 @@ class Payment(models.Model):
 
     @property
     def status(self):
-        """get the status of the payment.
+        """get the status of the payment, as last verified. It never calls the
+        payment gateway, use `refresh_status` to verify it again.
         we set a redirect url on cancel as a meta data on the request when initializing
         the payment. on cancel, the user gets redirected to that page with the order id in the url,
         an endpoint is called to cancel the payment. the payment status is updated on cancel.
 
         """
-        if (self.payment_status == Payment.PaymentStatus.PAID
-            or self.payment_status == Payment.PaymentStatus.REFUNDED):
+        return self.payment_status
+
+    @property
+    def is_final(self):
+        """a paid or refunded payment does not need to be verified again"""
+        return self.payment_status in (Payment.PaymentStatus.PAID, Payment.PaymentStatus.REFUNDED)
+
+    @classmethod
+    def status_from_gateway(cls, gateway_status, created_at=None):
+        """
+        Map a Paystack transaction status to a payment status, None if the
+        status is unknown. A transaction is `abandoned` until the customer
+        completes it, so it is only cancelled once the payment is older than
+        `PAYMENT_ABANDONED_AFTER` seconds.
+        """
+        if gateway_status == "abandoned":
+            abandoned_after = timedelta(seconds=settings.PAYMENT_ABANDONED_AFTER)
+            if created_at is not None and timezone.now() - created_at >= abandoned_after:
+                return cls.PaymentStatus.CANCELLED
+            return cls.PaymentStatus.PENDING
+        return {
+            "success": cls.PaymentStatus.PAID,
+            "reversed": cls.PaymentStatus.REFUNDED,
+            "failed": cls.PaymentStatus.CANCELLED,
+            "ongoing": cls.PaymentStatus.PENDING,
+            "pending": cls.PaymentStatus.PENDING,
+            "processing": cls.PaymentStatus.PENDING,
+            "queued": cls.PaymentStatus.PENDING,
+        }.get(gateway_status)
+
+    def refresh_status(self, max_age=None, force=False):
+        """
+        Verify the payment with the gateway and save its status, unless it is
+        final or was verified less than `max_age` seconds ago (the
+        `PAYMENT_VERIFY_TTL` setting by default). A single verification runs at
+        a time for a payment: concurrent calls return the last known status
+        instead of waiting for it. Returns the status. The transaction data
+        returned by the gateway is kept in `gateway_data` (None when the
+        gateway was not called).
+        """
+        self.gateway_data = None
+        max_age = settings.PAYMENT_VERIFY_TTL if max_age is None else max_age
+        if self.is_final and not force:
+            return self.payment_status
+        if (not force and self.last_verified_at
+                and timezone.now() - self.last_verified_at < timedelta(seconds=max_age)):
             return self.payment_status
-        response = verify_payment(self.reference)
-        data = response.get("data", {})
-        if response.get("status", False) and data.get("status") == "success":
-            self.payment_status = Payment.PaymentStatus.PAID
-            self.save()
-        # elif # add for other kinds `refunded`, `cancelled`, etc # failed, abandoned
 
+        cache = caches[settings.LOCK_CACHE_ALIAS]
+        lock_key = f"payments:verify:{self.reference}"
+        if not cache.add(lock_key, True, timeout=VERIFY_LOCK_TIMEOUT):
+            return self.payment_status
+        try:
+            response = verify_payment(self.reference)
+            data = response.get("data") or {}
+            payment_status = None
+            if response.get("status"):
+                payment_status = self.status_from_gateway(data.get("status"), self.created_at)
+            now = timezone.now()
+            payments = Payment.objects.filter(pk=self.pk)
+            with transaction.atomic():
+                payments.update(last_verified_at=now)
+                payments.apply_status(payment_status)
+            # the payment may have been changed by someone else meanwhile
+            # (e.g paid by a webhook), so the update may not have applied
+            self.refresh_from_db(fields=["payment_status", "verified", "updated_at"])
+            self.last_verified_at = now
+            self.gateway_data = data
+        finally:
+            cache.delete(lock_key)
         return self.payment_status
 
     def __str__(self):
         """string representation"""
         return f"[Payment] {settings.STORE_CURRENCY} {self.amount} for {self.order}"
+
+
+class WebhookEvent(models.Model):
+    """
+    A webhook event received from the payment gateway. Events are stored
+    and acknowledged right away, then processed in batches by the
+    `process_webhook_events` command. The gateway sends an event again
+    until it is acknowledged: `dedup_key` keeps a single row per event.
+    """
+    class EventStatus(models.TextChoices):
+        PENDING = "pending", "Pending"
+        PROCESSING = "processing", "Processing"
+        PROCESSED = "processed", "Processed"
+        FAILED = "failed", "Failed"
+
+    id = models.UUIDField(
+        unique=True, primary_key=True, default=uuid.uuid4, editable=False
+    )
+    dedup_key = models.CharField(max_length=200, unique=True, editable=False)
+    event = models.CharField(max_length=100)
+    reference = models.CharField(max_length=50, blank=True)
+    payload = models.JSONField()
+    status = models.CharField(
+        max_length=20,
+        choices=EventStatus.choices,
+        default=EventStatus.PENDING,
+        help_text="The processing status of the event"
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Webhook Event"
+        verbose_name_plural = "Webhook Events"
+        ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="webhookevent_status_idx"),
+        ]
+
+    @staticmethod
+    def make_dedup_key(event: str, data: dict):
+        """the same event of a transaction has the same key"""
+        return f"{event}:{data.get('id') or data.get('reference')}"
+
+    @classmethod
+    def record(cls, payload: dict):
+        """store an event, in a single query. An event already
+        received is ignored"""
+        event = payload.get("event", "")
+        data = payload.get("data") or {}
+        cls.objects.bulk_create(
+            [cls(
+                dedup_key=cls.make_dedup_key(event, data),
+                event=event,
+                reference=data.get("reference") or "",
+                payload=payload,
+            )],
+            ignore_conflicts=True,
+        )
+
+    def __str__(self):
+        return f"[WebhookEvent] {self.event} {self.reference}"
@@ -0,0 +1,95 @@
+"""
+Reconciliation of the pending payments with the payment gateway.
+
+Pending payments are read in chunks (by primary key), the payments of a
+chunk are verified concurrently by a bounded pool of threads, with a limit
+on the number of requests per second sent to the gateway, and their new
+status is saved with one conditional update per status and chunk.
+"""
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from common.services.payment_service import verify_payment
+from common.utils.custom_exceptions import ServiceUnavailable
+
+from .models import Payment
+
+
+class RateLimiter:
+    """allow at most `rate` calls per second, shared by threads"""
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self.next_call = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _verify(payment: Payment, limiter: RateLimiter):
+    """return the payment status of a transaction, None if it is unknown
+    or `error` if it could not be verified"""
+    limiter.wait()
+    try:
+        response = verify_payment(payment.reference)
+    except ServiceUnavailable:
+        return "error"
+    if not response.get("status"):
+        return "error"
+    return Payment.status_from_gateway((response.get("data") or {}).get("status"), payment.created_at)
+
+
+def reconcile_payments(chunk_size=200, workers=8, rate=20.0, min_age=timedelta(minutes=5)):
+    """
+    Verify the payments pending for more than `min_age` and save their
+    status. Returns a counter of the payments per resulting status (`pending`
+    when still in progress and `error` when the gateway could not verify them)
+    """
+    limiter = RateLimiter(rate)
+    counts = Counter()
+    payments = Payment.objects.filter(
+        payment_status=Payment.PaymentStatus.PENDING,
+        created_at__lte=timezone.now() - min_age,
+    ).order_by("pk")
+
+    last_pk = None
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            chunk = payments.filter(pk__gt=last_pk) if last_pk else payments
+            chunk = list(chunk[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+
+            statuses = executor.map(lambda p: _verify(p, limiter), chunk)
+            verified, by_status = [], {}
+            for payment, status in zip(chunk, statuses):
+                if status == "error":
+                    counts["error"] += 1
+                    continue
+                verified.append(payment.pk)
+                if status and status != Payment.PaymentStatus.PENDING:
+                    by_status.setdefault(status, []).append(payment.pk)
+                counts[status or payment.payment_status] += 1
+            """only the verification date is written for every payment, the new
+            statuses are applied with conditional updates, so a payment changed
+            while it was being verified (e.g paid by a webhook) is not reverted"""
+            now = timezone.now()
+            with transaction.atomic():
+                Payment.objects.filter(pk__in=verified).update(last_verified_at=now)
+                for status, pks in by_status.items():
+                    Payment.objects.filter(pk__in=pks).apply_status(status)
+    return counts
@@ -2,3 +2,6 @@ from rest_framework import serializers
 
 class VerifyPaymentSerializer(serializers.Serializer):
     reference = serializers.CharField(required=True)
+    summary = serializers.BooleanField(
+        required=False, default=False, help_text="Return a summary of the order instead of the full order"
+    )
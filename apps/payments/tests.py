@@ -1,3 +1,446 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse_lazy
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.orders.models import Order
+from apps.products.models import Product
+from common.services.fake_paystack import FakePaystackServer
+from common.services.payment_service import get_client, verify_payment
+from common.utils.custom_exceptions import ServiceUnavailable
+from .models import Payment, WebhookEvent
+from .reconciliation import reconcile_payments
+from .webhooks import MAX_ATTEMPTS, process_events
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    """answers verify requests, failing the first `failures` of them"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.client_address)
+        failed = len(server.requests) <= server.failures
+        body = json.dumps({"status": not failed, "data": {"status": "success"}}).encode()
+        self.send_response(503 if failed else 200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PaystackClientTest(SimpleTestCase):
+    def setUp(self) -> None:
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), GatewayHandler)
+        self.server.requests = []
+        self.server.failures = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        settings = override_settings(
+            PAYSTACK_BASE_URL=f"http://127.0.0.1:{self.server.server_port}",
+            PAYSTACK_KEY="secret",
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_client_follows_settings(self):
+        client = get_client()
+        self.assertIs(get_client(), client)
+        self.assertEqual(client.base_url, f"http://127.0.0.1:{self.server.server_port}")
+        with override_settings(PAYSTACK_READ_TIMEOUT=5):
+            self.assertEqual(get_client().timeout[1], 5)
+        self.assertIsNot(get_client(), client)
+
+    def test_connection_reused(self):
+        verify_payment("ref1")
+        verify_payment("ref2")
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.requests[0], self.server.requests[1])
+
+    def test_verify_retried(self):
+        self.server.failures = 1
+        with override_settings(PAYSTACK_MAX_RETRIES=1):
+            response = verify_payment("ref")
+        self.assertTrue(response["status"])
+        self.assertEqual(len(self.server.requests), 2)
+
+
+@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+class FakePaystackFlowTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = User.objects.create_user(
+            email="testemail@gmail.com",
+            password="testpassword",
+            first_name="test",
+            last_name="user",
+        )
+        cls.product = Product.objects.create(
+            name="product", description="description", price=1000, stock_quantity=10
+        )
+
+    def setUp(self) -> None:
+        self.gateway = FakePaystackServer(secret_key="secret", seed=1).start()
+        self.addCleanup(self.gateway.stop)
+        settings = override_settings(
+            PAYSTACK_BASE_URL=self.gateway.url, PAYSTACK_KEY="secret", IP_WHITELIST=["127.0.0.1"]
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def place_order(self):
+        data = {
+            "items": [{"product": self.product.pk, "quantity": 2}],
+            "delivery_address_line1": "1 test street",
+            "delivery_address_closest_busstop": "test busstop",
+            "delivery_address_city": "test city",
+            "delivery_address_state": "test state",
+            "delivery_address_country": "test country",
+        }
+        return self.client.post(reverse_lazy("order-list"), data, format="json")
+
+    def test_order_paid_with_webhook(self):
+        response = self.place_order()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        payment = Payment.objects.get(order_id=response.data["data"]["order_id"])
+        self.assertEqual(self.gateway.transactions[payment.reference]["amount"], 200000)
+
+        self.gateway.pay(payment.reference)
+        body, headers = self.gateway.webhook(payment.reference)
+        for _ in range(2): # the gateway retries the webhook
+            response = self.client.post(
+                reverse_lazy("webhook"), body, content_type="application/json",
+                headers={"x-paystack-signature": headers["X-Paystack-Signature"]},
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        payment.refresh_from_db()
+        self.assertEqual(payment.payment_status, Payment.PaymentStatus.PENDING)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+
+        self.assertEqual(process_events(), 1)
+        payment.refresh_from_db()
+        self.assertEqual(payment.payment_status, Payment.PaymentStatus.PAID)
+        self.assertIsNotNone(payment.order.paid_at)
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.EventStatus.PROCESSED)
+
+    def test_gateway_errors(self):
+        self.gateway.error_rate = 1
+        with self.assertLogs("common.services.payment_service", "ERROR"), \
+                self.assertLogs("apps.orders.views", "ERROR"):
+            response = self.place_order()
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertTrue(Order.objects.filter(pk=response.data["data"]["order_id"]).exists())
+
+
+def create_payment(reference="ref"):
+    """create a pending payment for a new order"""
+    user = User.objects.create_user(
+        email=f"{reference}@gmail.com",
+        password="testpassword",
+        first_name="test",
+        last_name="user",
+    )
+    order = Order.objects.create(
+        customer=user,
+        delivery_address_line1="1 test street",
+        delivery_address_closest_busstop="test busstop",
+        delivery_address_city="test city",
+        delivery_address_state="test state",
+        delivery_address_country="test country",
+    )
+    return Payment.objects.create(reference=reference, amount=1000, currency="NGN", order=order)
+
+
+@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+class PaymentStatusTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.payment = create_payment()
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    @mock.patch("apps.payments.models.verify_payment")
+    def test_status_does_not_call_gateway(self, verify):
+        self.assertEqual(self.payment.status, Payment.PaymentStatus.PENDING)
+        verify.assert_not_called()
+
+    @mock.patch("apps.payments.models.verify_payment")
+    def test_refresh_status(self, verify):
+        verify.return_value = {"status": True, "data": {"status": "abandoned"}}
+        self.assertEqual(self.payment.refresh_status(), Payment.PaymentStatus.PENDING)
+        self.assertEqual(self.payment.refresh_status(), Payment.PaymentStatus.PENDING)
+        self.assertEqual(verify.call_count, 1) # verified recently
+
+        verify.return_value = {"status": True, "data": {"status": "success"}}
+        self.assertEqual(self.payment.refresh_status(max_age=0), Payment.PaymentStatus.PAID)
+        self.payment.refresh_from_db()
+        self.assertTrue(self.payment.verified)
+        self.assertIsNotNone(self.payment.last_verified_at)
+        self.payment.refresh_status(max_age=0)
+        self.assertEqual(verify.call_count, 2) # paid is final
+
+    @mock.patch("apps.payments.models.verify_payment")
+    def test_refresh_status_gateway_statuses(self, verify):
+        for gateway_status, payment_status in [
+            ("ongoing", Payment.PaymentStatus.PENDING),
+            ("abandoned", Payment.PaymentStatus.PENDING), # the customer may still complete it
+            ("failed", Payment.PaymentStatus.CANCELLED),
+            ("pending", Payment.PaymentStatus.CANCELLED), # a cancelled payment is never pending again
+            ("success", Payment.PaymentStatus.PAID), # the customer was charged after all
+        ]:
+            verify.return_value = {"status": True, "data": {"status": gateway_status}}
+            self.assertEqual(self.payment.refresh_status(max_age=0), payment_status)
+
+    @mock.patch("apps.payments.models.verify_payment")
+    def test_refresh_status_abandoned_and_reversed(self, verify):
+        Payment.objects.filter(pk=self.payment.pk).update(created_at=timezone.now() - timedelta(days=1))
+        self.payment.refresh_from_db()
+        verify.return_value = {"status": True, "data": {"status": "abandoned"}}
+        self.assertEqual(self.payment.refresh_status(max_age=0), Payment.PaymentStatus.CANCELLED)
+
+        Payment.objects.filter(pk=self.payment.pk).update(payment_status=Payment.PaymentStatus.PAID)
+        self.payment.refresh_from_db()
+        verify.return_value = {"status": True, "data": {"status": "reversed"}}
+        self.assertEqual(self.payment.refresh_status(force=True), Payment.PaymentStatus.REFUNDED)
+
+    @mock.patch("apps.payments.models.verify_payment")
+    def test_unchanged_status_keeps_updated_at(self, verify):
+        """the order validators depend on the update date of its payments"""
+        updated_at = self.payment.updated_at
+        verify.return_value = {"status": True, "data": {"status": "ongoing"}}
+        self.payment.refresh_status(max_age=0)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.updated_at, updated_at)
+        self.assertIsNotNone(self.payment.last_verified_at)
+
+        verify.return_value = {"status": True, "data": {"status": "success"}}
+        self.payment.refresh_status(max_age=0)
+        self.assertGreater(self.payment.updated_at, updated_at)
+
+    @mock.patch("apps.payments.models.verify_payment")
+    def test_payment_paid_during_verification(self, verify):
+        """a webhook marks the payment as paid while the gateway is called"""
+        def paid_meanwhile(reference):
+            Payment.objects.filter(reference=reference).mark_paid()
+            return {"status": True, "data": {"status": "success"}}
+
+        verify.side_effect = paid_meanwhile
+        self.assertEqual(self.payment.refresh_status(), Payment.PaymentStatus.PAID)
+        self.assertTrue(self.payment.verified)
+
+    @mock.patch("apps.payments.models.verify_payment")
+    def test_concurrent_refresh_coalesced(self, verify):
+        caches[settings.LOCK_CACHE_ALIAS].add(f"payments:verify:{self.payment.reference}", True)
+        self.assertEqual(self.payment.refresh_status(), Payment.PaymentStatus.PENDING)
+        verify.assert_not_called()
+
+
+@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+class WebhookEventProcessingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.payment = create_payment()
+
+    def receive(self, reference, event="charge.success"):
+        WebhookEvent.record({"event": event, "data": {"reference": reference}})
+
+    def test_batch(self):
+        self.receive(self.payment.reference)
+        self.receive("other", event="transfer.success")
+        with self.assertNumQueries(11):
+            self.assertEqual(process_events(), 2)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.payment_status, Payment.PaymentStatus.PAID)
+        self.assertEqual(
+            WebhookEvent.objects.filter(status=WebhookEvent.EventStatus.PROCESSED).count(), 2
+        )
+
+    def test_unknown_payment_retried_then_failed(self):
+        self.receive("unknown")
+        for _ in range(MAX_ATTEMPTS):
+            with self.assertLogs("apps.payments.webhooks", "WARNING"):
+                process_events()
+        event = WebhookEvent.objects.get()
+        self.assertEqual(event.status, WebhookEvent.EventStatus.FAILED)
+        self.assertEqual(event.attempts, MAX_ATTEMPTS)
+        self.assertEqual(process_events(), 0)
+
+
+@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+class ReconcilePaymentsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.statuses = {
+            "paid": "success", "failed": "failed", "left": "abandoned", "open": "ongoing", "down": None,
+        }
+        for reference in cls.statuses:
+            create_payment(reference)
+        Payment.objects.update(created_at=timezone.now() - timedelta(hours=2))
+
+    def verify(self, reference):
+        if self.statuses[reference] is None:
+            raise ServiceUnavailable
+        return {"status": True, "data": {"status": self.statuses[reference]}}
+
+    def test_reconcile(self):
+        updated_at = Payment.objects.get(reference="open").updated_at
+        with mock.patch("apps.payments.reconciliation.verify_payment", side_effect=self.verify):
+            counts = reconcile_payments(chunk_size=3, workers=2, rate=0)
+        self.assertEqual(counts, {"paid": 1, "cancelled": 2, "pending": 1, "error": 1})
+        payments = {p.reference: p for p in Payment.objects.all()}
+        self.assertEqual(payments["paid"].payment_status, Payment.PaymentStatus.PAID)
+        self.assertTrue(payments["paid"].verified)
+        self.assertEqual(payments["failed"].payment_status, Payment.PaymentStatus.CANCELLED)
+        self.assertEqual(payments["left"].payment_status, Payment.PaymentStatus.CANCELLED)
+        self.assertEqual(payments["open"].payment_status, Payment.PaymentStatus.PENDING)
+        self.assertIsNotNone(payments["open"].last_verified_at)
+        self.assertEqual(payments["open"].updated_at, updated_at) # unchanged
+        self.assertIsNone(payments["down"].last_verified_at)
+
+    def test_payment_paid_during_verification_kept(self):
+        """a webhook marks payments as paid while they are being verified"""
+        def verify(reference):
+            if reference in ("open", "failed"):
+                Payment.objects.filter(reference=reference).mark_paid()
+            return self.verify(reference)
+
+        class InlineExecutor:
+            """verify in the test thread, which holds the test transaction"""
+            def __init__(self, max_workers):
+                pass
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            map = staticmethod(map)
+
+        with mock.patch("apps.payments.reconciliation.ThreadPoolExecutor", InlineExecutor), \
+                mock.patch("apps.payments.reconciliation.verify_payment", side_effect=verify):
+            reconcile_payments(chunk_size=10, workers=1, rate=0)
+        payments = {p.reference: p for p in Payment.objects.all()}
+        self.assertEqual(payments["open"].payment_status, Payment.PaymentStatus.PAID)
+        self.assertEqual(payments["failed"].payment_status, Payment.PaymentStatus.PAID)
+        self.assertIsNotNone(payments["open"].last_verified_at)
+
+    def test_command(self):
+        out = StringIO()
+        with mock.patch("apps.payments.reconciliation.verify_payment", side_effect=self.verify):
+            call_command("reconcile_payments", "--min-age=0", stdout=out)
+        self.assertIn("Checked 5 payment(s)", out.getvalue())
+
+
+@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+class VerifyPaymentViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.payment = create_payment()
+        for i in range(3):
+            product = Product.objects.create(
+                name=f"product {i}", description="description", price=100, stock_quantity=10
+            )
+            cls.payment.order.items.create(product=product, quantity=1, unit_price=product.price)
+        order = cls.payment.order
+        order.set_totals(order.items.all())
+        order.save()
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.payment.order.customer)
+        self.url = reverse_lazy("verify-payment", kwargs={"reference": self.payment.reference})
+        cache.clear()
+        patcher = mock.patch("apps.payments.models.verify_payment", return_value={
+            "status": True, "data": {"status": "success", "reference": self.payment.reference}
+        })
+        self.verify = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_verify_queries(self):
+        """payment, items, the verification date and the paid updates (in
+        savepoints), the saved status, the paid date of the order and the
+        order payments"""
+        with self.assertNumQueries(12):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        order = response.data["data"]["order"]
+        self.assertEqual(len(order["items"]), 3)
+        self.assertEqual(order["total_amount"], 300.0)
+        self.assertEqual(order["payment_status"], Payment.PaymentStatus.PAID)
+
+    def test_verify_uses_ttl(self):
+        self.verify.return_value = {"status": True, "data": {"status": "ongoing"}}
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertEqual(self.verify.call_count, 1)
+        self.assertEqual(response.data["data"]["payment_status"], Payment.PaymentStatus.PENDING)
+        self.assertIsNone(response.data["data"]["status"])
+
+    def test_verify_failed(self):
+        self.verify.return_value = {"status": True, "data": {"status": "failed"}}
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["data"]["payment_status"], Payment.PaymentStatus.CANCELLED)
+        self.assertEqual(response.data["data"]["order"]["payment_status"], Payment.PaymentStatus.CANCELLED)
+
+    def test_verify_paid_by_webhook_meanwhile(self):
+        def paid_meanwhile(reference):
+            Payment.objects.filter(reference=reference).mark_paid()
+            return {"status": True, "data": {"status": "success"}}
+
+        self.verify.side_effect = paid_meanwhile
+        response = self.client.get(self.url)
+        data = response.data["data"]
+        self.assertEqual(data["status"], "success")
+        self.assertEqual(data["payment_status"], Payment.PaymentStatus.PAID)
+        self.assertIsNotNone(data["order"]["paid_at"])
+
+    def test_verify_summary(self):
+        response = self.client.get(self.url, {"summary": "true"})
+        order = response.data["data"]["order"]
+        self.assertNotIn("items", order)
+        self.assertEqual(order["order_number"], self.payment.order.order_number)
+        self.assertEqual(order["total_amount"], 300.0)
+
+
+@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+class MarkPaidTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.payment = create_payment()
+
+    def test_mark_paid_once(self):
+        payments = Payment.objects.filter(reference=self.payment.reference)
+        self.assertEqual(payments.mark_paid(), 1)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.payment_status, Payment.PaymentStatus.PAID)
+        self.assertTrue(self.payment.verified)
+        paid_at = Order.objects.get(pk=self.payment.order_id).paid_at
+        self.assertIsNotNone(paid_at)
+
+        with self.assertNumQueries(3): # the UPDATE in a savepoint
+            self.assertEqual(payments.mark_paid(), 0)
+        self.assertEqual(Order.objects.get(pk=self.payment.order_id).paid_at, paid_at)
+
+    def test_refunded_not_paid(self):
+        Payment.objects.update(payment_status=Payment.PaymentStatus.REFUNDED)
+        self.assertEqual(Payment.objects.all().mark_paid(), 0)
@@ -4,6 +4,7 @@ import json
 import logging
 
 from django.conf import settings
+from django.db.models import Prefetch, prefetch_related_objects
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status
@@ -11,9 +12,9 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 
 from common.utils.responses import error_response, success_response
-from common.services.payment_service import verify_payment
-from apps.payments.models import Payment
-from apps.orders.serializers import OrderSerializer
+from apps.payments.models import Payment, WebhookEvent
+from apps.orders.models import OrderItem
+from apps.orders.serializers import OrderSerializer, OrderSummarySerializer
 
 from .serializers import VerifyPaymentSerializer
 
@@ -24,22 +25,43 @@ class VerifyPaymentView(APIView):
     permission_classes = [IsAuthenticated]
     http_method_names = ["get"]
 
+    def get_payment(self, request, reference):
+        """load the payment with its order, the order items and their
+        product, in a fixed number of queries"""
+        items = OrderItem.objects.select_related("product", "applied_discount")
+        return (
+            Payment.objects.select_related("order__applied_discount")
+            .prefetch_related(Prefetch("order__items", queryset=items))
+            .get(reference=reference, order__customer=request.user)
+        )
+
     def get(self, request, reference):
-        serializer = VerifyPaymentSerializer(data={"reference": reference})
+        serializer = VerifyPaymentSerializer(data={
+            "reference": reference, "summary": request.query_params.get("summary", False)
+        })
         serializer.is_valid(raise_exception=True)
         try:
-            response = verify_payment(reference)
-            payment = Payment.objects.get(reference=reference, order__customer=request.user)
-            data = response.get("data", {})
+            payment = self.get_payment(request, reference)
+            previous_status = payment.payment_status
+            """the gateway is only asked when the payment was not verified in the last
+            `PAYMENT_VERIFY_TTL` seconds, and by one request at a time"""
+            payment.refresh_status()
+            if payment.payment_status != previous_status == Payment.PaymentStatus.PENDING:
+                # the order was updated with the payment (e.g its paid date)
+                payment.order.refresh_from_db(fields=["paid_at", "updated_at"])
+            # loaded after the payment is saved, for the order payment status
+            prefetch_related_objects([payment.order], "payments")
 
-            if response.get("status", False) and data.get("status") == "success":
-                payment.payment_status = Payment.PaymentStatus.PAID
-                payment.verified = True
-                payment.save(update_fields=["payment_status", "verified"])
-            
-            order = OrderSerializer(payment.order).data
+            order_serializer = (
+                OrderSummarySerializer if serializer.validated_data["summary"] else OrderSerializer
+            )
+            order = order_serializer(payment.order).data
+            data = payment.gateway_data or {}
             res_data = {
-                "reference": data.get("reference"),
+                "reference": payment.reference,
+                "payment_status": payment.payment_status,
+                "verified_at": payment.last_verified_at,
+                # the transaction details, when the gateway was asked by this request
                 "status": data.get("status"),
                 "amount": data.get("amount"),
                 "currency": data.get("currency"),
@@ -82,8 +104,12 @@ class WebhookView(APIView):
         event = self._parse_event(request)
         if event is None:
             return error_response("Invalid Payload", status.HTTP_400_BAD_REQUEST)
-        result = self._handle_event(event)
-        return result or success_response({}, "Verified successfully", status_code=status.HTTP_200_OK)
+        if not (event.get("data") or {}).get("reference"):
+            return error_response("Missing transaction reference.", status.HTTP_400_BAD_REQUEST)
+        """the event is only stored here, so it is acknowledged right away. It is
+        processed by the `process_webhook_events` command"""
+        WebhookEvent.record(event)
+        return success_response({}, "Verified successfully", status_code=status.HTTP_200_OK)
 
     def _is_valid_ip(self, request):
         """check that the request came from a valid IP"""
@@ -101,35 +127,12 @@ class WebhookView(APIView):
     
     def _parse_event(self, request):
         try:
-            return (
+            event = (
                 request.data
                 if isinstance(request.data, dict)
                 else json.loads(request.body)
             )
+            return event if isinstance(event, dict) else None
         except Exception as e:
             logger.error(f"Exception in WebhookView._parse_event: {e}", exc_info=True)
             return None
-    
-    def _handle_event(self, event):
-        event_type = event.get("event")
-        data = event.get("data", {})
-        reference = data.get("reference")
-        if not reference:
-            return error_response("Missing transaction reference.", status.HTTP_400_BAD_REQUEST)
-        if event_type == "charge.success":
-            try:
-                payment = Payment.objects.get(reference=reference)
-                payment.verified = True
-                payment.save(update_fields=["verified"])
-
-                if payment.payment_status != Payment.PaymentStatus.PAID:
-                    payment.payment_status = Payment.PaymentStatus.PAID
-                    payment.save(update_fields=["payment_status"])
-            except Payment.DoesNotExist as e:
-                logger.warning(f"Payment.DoesNotExist in WebhookView._handle_event: {e}\n\nEvent data: {data}")
-                return error_response("Transaction not found", status_code=status.HTTP_404_NOT_FOUND)
-            except Exception as e:
-                logger.error(f"Error handling charge.success event: {e}", exc_info=True)
-                return error_response("Error handling charge.success event.", status_code=status.HTTP_400_BAD_REQUEST)
-            
-        return None
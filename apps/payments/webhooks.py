@@ -0,0 +1,101 @@
+"""
+Processing of the webhook events stored by the `WebhookView`.
+
+Events are claimed in batches, so several workers (`process_webhook_events`
+command) can run at the same time without processing an event twice, and
+the payments of a batch are updated with a few bulk queries. An event that
+can not be processed is retried by a later batch, up to `MAX_ATTEMPTS` times.
+An event claimed by a worker that stopped before finishing it is claimed
+again after `STALE_CLAIM_AFTER`.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Payment, WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+STALE_CLAIM_AFTER = timedelta(minutes=5)
+
+
+def claim_events(batch_size=100):
+    """claim the oldest pending events for the current worker"""
+    now = timezone.now()
+    claimable = (
+        Q(status=WebhookEvent.EventStatus.PENDING)
+        | Q(status=WebhookEvent.EventStatus.PROCESSING, claimed_at__lt=now - STALE_CLAIM_AFTER)
+    )
+    ids = list(
+        WebhookEvent.objects.filter(claimable)
+        .order_by("created_at").values_list("pk", flat=True)[:batch_size]
+    )
+    if not ids:
+        return []
+    WebhookEvent.objects.filter(claimable, pk__in=ids).update(
+        status=WebhookEvent.EventStatus.PROCESSING, claimed_at=now, attempts=F("attempts") + 1
+    )
+    return list(WebhookEvent.objects.filter(
+        pk__in=ids, status=WebhookEvent.EventStatus.PROCESSING, claimed_at=now
+    ))
+
+
+def handle_charge_success(events):
+    """mark the payments of the events (and their orders) as paid.
+    Returns the events whose payment was not found"""
+    references = {event.reference for event in events}
+    found = set(
+        Payment.objects.filter(reference__in=references).values_list("reference", flat=True)
+    )
+    Payment.objects.filter(reference__in=found).mark_paid()
+    return [event for event in events if event.reference not in found]
+
+
+HANDLERS = {
+    "charge.success": handle_charge_success,
+}
+"""the handler of each event type. Other events are acknowledged and ignored"""
+
+
+def _retry_or_fail(events, error: str):
+    ids = [event.pk for event in events]
+    WebhookEvent.objects.filter(pk__in=ids, attempts__gte=MAX_ATTEMPTS).update(
+        status=WebhookEvent.EventStatus.FAILED, error=error
+    )
+    WebhookEvent.objects.filter(pk__in=ids, attempts__lt=MAX_ATTEMPTS).update(
+        status=WebhookEvent.EventStatus.PENDING, error=error
+    )
+
+
+def process_events(batch_size=100):
+    """process a batch of events. Returns the number of events claimed"""
+    events = claim_events(batch_size)
+    if not events:
+        return 0
+
+    by_type = {}
+    for event in events:
+        by_type.setdefault(event.event, []).append(event)
+
+    unprocessed = []
+    try:
+        with transaction.atomic():
+            for event_type, handler in HANDLERS.items():
+                if event_type in by_type:
+                    unprocessed += handler(by_type[event_type])
+            WebhookEvent.objects.filter(
+                pk__in=[event.pk for event in events if event not in unprocessed]
+            ).update(status=WebhookEvent.EventStatus.PROCESSED, processed_at=timezone.now(), error="")
+    except Exception as e:
+        logger.error("Error while processing webhook events: %s", e, exc_info=True)
+        _retry_or_fail(events, str(e))
+        return len(events)
+
+    if unprocessed:
+        logger.warning("Payment not found for webhook event(s): %s", [e.reference for e in unprocessed])
+        _retry_or_fail(unprocessed, "Transaction not found")
+    return len(events)
@@ -1,8 +1,9 @@
 from django.contrib import admin
 
-from .models import Product, ProductImage, Category, Tag
+from .models import Product, ProductImage, ProductRating, Category, Tag
 
 admin.site.register(Product)
 admin.site.register(ProductImage)
 admin.site.register(Category)
-admin.site.register(Tag)
\ No newline at end of file
+admin.site.register(Tag)
+admin.site.register(ProductRating)
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""
+Cache helpers for the product catalog.
+
+Cached catalog data is keyed with versions. Instead of deleting cached
+entries when the catalog changes, the versions the entries depend on are
+bumped, so every entry cached under a previous version is no longer used
+and expires on its own. There is a version for:
+
+- the whole catalog (`catalog`): product lists and facets,
+- each product (`product:<id>`): the product detail,
+- each category (`category:<name>`): product lists filtered by category.
+
+A version starts from the current time (in ms) so it keeps increasing even
+if its key is evicted from the cache. The replicas may not have the change
+yet when a version is bumped, so the catalog is read from the primary
+database for `READ_YOUR_WRITES_WINDOW` seconds, or stale data would be
+cached (and used as ETag) under the new version.
+The cache used is the one named by the `CATALOG_CACHE_ALIAS` setting.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+from common.middleware import pin_all_reads
+from .models import Category
+
+VERSION_KEY_PREFIX = "products:version"
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def _version_key(scope: str):
+    return f"{VERSION_KEY_PREFIX}:{scope}"
+
+
+def get_versions(*scopes: str):
+    """return the current version of each scope"""
+    cache = get_cache()
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        initial = int(time.time() * 1000)
+        for key in missing:
+            cache.add(key, initial, timeout=None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+def get_catalog_version():
+    """return the current version of the catalog"""
+    return get_versions("catalog")[0]
+
+
+def bump_versions(*scopes: str):
+    """
+    Move the scopes to a new version once the current transaction is
+    committed, so a concurrent request can not cache the data from
+    before the change under the new version.
+    """
+    transaction.on_commit(lambda: _incr_versions(scopes))
+
+
+def _incr_versions(scopes):
+    pin_all_reads() # before the new versions can be read
+    cache = get_cache()
+    for scope in set(scopes):
+        try:
+            cache.incr(_version_key(scope))
+        except ValueError:
+            get_versions(scope)
+
+
+def invalidate_products(product_ids, categories=None):
+    """
+    Invalidate the cached catalog data that includes the given products:
+    their detail, the product lists of their categories and the catalog.
+    `categories` are the names of the categories the products are in.
+    They are looked up when not given.
+    """
+    product_ids = list(product_ids)
+    if categories is None:
+        categories = (
+            Category.objects.filter(products__in=product_ids)
+            .values_list("name", flat=True).distinct()
+        )
+    bump_versions(
+        "catalog",
+        *[f"product:{pk}" for pk in product_ids],
+        *[f"category:{name}" for name in categories],
+    )
+
+
+def invalidate_categories(categories, product_ids=()):
+    """invalidate the catalog data of categories (and of their products)"""
+    bump_versions(
+        "catalog",
+        *[f"category:{name}" for name in categories],
+        *[f"product:{pk}" for pk in product_ids],
+    )
+
+
+def _digest(params: dict):
+    signature = "&".join(
+        f"{key}={value}" for key, value in sorted(params.items())
+    )
+    return hashlib.md5(signature.encode("utf-8")).hexdigest()
+
+
+def make_cache_key(prefix: str, params: dict, scopes=("catalog",)):
+    """build a cache key from a prefix, the versions of the scopes
+    the data depends on and query params"""
+    versions = ".".join(str(version) for version in get_versions(*scopes))
+    return f"{prefix}:{versions}:{_digest(params)}"
+
+
+def cached_response(key: str, build_response):
+    """
+    Return the response cached under the key, or build it with
+    `build_response` and cache it if it is successful.
+    """
+    cache = get_cache()
+    data = cache.get(key)
+    if data is not None:
+        return Response(data)
+    response = build_response()
+    if response.status_code == 200:
+        cache.set(key, response.data, settings.CATALOG_CACHE_TIMEOUT)
+    return response
@@ -0,0 +1,89 @@
+"""
+Facet counts for the storefront filter sidebar: how many products of
+a (filtered) product set are in each category, tag, type and price range.
+All the counts are computed by the database in a single query (one
+grouped query per facet, combined with `UNION ALL`).
+"""
+from django.conf import settings
+from django.db.models import Case, CharField, Count, F, Value, When
+
+from .cache import get_cache, make_cache_key
+
+FACET_NAMES = {
+    "category": "categories",
+    "tag": "tags",
+    "type": "types",
+    "price": "price_ranges",
+}
+
+
+def get_price_buckets():
+    """return the price ranges as (min, max) tuples. The last one has no max"""
+    bounds = [0] + list(settings.PRODUCT_PRICE_FACET_BUCKETS)
+    return list(zip(bounds, bounds[1:] + [None]))
+
+
+def _price_label(lower, upper):
+    return f"{lower}-{upper}" if upper is not None else f"{lower}+"
+
+
+def _facet(queryset, name, value):
+    return (
+        queryset.annotate(facet=Value(name), value=value)
+        .values("facet", "value")
+        .annotate(count=Count("pk", distinct=True))
+        .values_list("facet", "value", "count")
+    )
+
+
+def compute_facets(queryset):
+    """return the facet counts of the products in the queryset"""
+    queryset = queryset.order_by()
+    buckets = get_price_buckets()
+    price = Case(
+        *[
+            When(price__lt=upper, then=Value(_price_label(lower, upper)))
+            for lower, upper in buckets[:-1]
+        ],
+        default=Value(_price_label(*buckets[-1])),
+        output_field=CharField(),
+    )
+    rows = _facet(queryset, "category", F("categories__name")).union(
+        _facet(queryset, "tag", F("tags__name")),
+        _facet(queryset, "type", F("type")),
+        _facet(queryset, "price", price),
+        all=True,
+    )
+
+    facets = {name: [] for name in FACET_NAMES.values()}
+    counts = {}
+    for facet, value, count in rows:
+        if value is None: # products without a tag
+            continue
+        counts[(facet, value)] = count
+        if facet != "price":
+            facets[FACET_NAMES[facet]].append({"value": value, "count": count})
+    for facet in facets.values():
+        facet.sort(key=lambda i: (-i["count"], i["value"]))
+
+    facets["price_ranges"] = [
+        {
+            "min_price": lower,
+            "max_price": upper,
+            "count": counts.get(("price", _price_label(lower, upper)), 0),
+        }
+        for lower, upper in buckets
+    ]
+    return facets
+
+
+def get_facets(queryset, params: dict):
+    """return the facet counts of a filtered product queryset. The result
+    is cached per filter params until the catalog changes"""
+    cache = get_cache()
+    key = make_cache_key("products:facets", params)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset)
+        cache.set(key, facets, settings.CATALOG_CACHE_TIMEOUT)
+    return facets
@@ -0,0 +1,37 @@
+from django_filters import rest_framework as filters
+
+from .models import Product
+
+
+class ProductFilter(filters.FilterSet):
+    """
+    Filter the product list by category, tag, type, price range and stock.
+    `category` and `tag` accept a comma separated list of names and match
+    products in any of them. They are applied as subqueries on the M2M tables
+    so a product is never returned twice.
+    """
+    category = filters.CharFilter(method="filter_category")
+    tag = filters.CharFilter(method="filter_tag")
+    type = filters.ChoiceFilter(choices=Product.ProductType.choices)
+    min_price = filters.NumberFilter(field_name="price", lookup_expr="gte")
+    max_price = filters.NumberFilter(field_name="price", lookup_expr="lte")
+    in_stock = filters.BooleanFilter(method="filter_in_stock")
+
+    class Meta:
+        model = Product
+        fields = ["category", "tag", "type", "min_price", "max_price", "in_stock"]
+
+    def filter_category(self, queryset, name, value):
+        names = [i.strip() for i in value.split(",") if i.strip()]
+        through = Product.categories.through.objects.filter(category__name__in=names)
+        return queryset.filter(pk__in=through.values("product_id"))
+
+    def filter_tag(self, queryset, name, value):
+        names = [i.strip() for i in value.split(",") if i.strip()]
+        through = Product.tags.through.objects.filter(tag__name__in=names)
+        return queryset.filter(pk__in=through.values("product_id"))
+
+    def filter_in_stock(self, queryset, name, value):
+        if value:
+            return queryset.filter(stock_quantity__gt=0)
+        return queryset.filter(stock_quantity=0)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.products.models import ProductRating
+
+
+class Command(BaseCommand):
+    help = "Rebuild the rating summary of every product from its reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Number of summaries written per query. Defaults to 1000"
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = ProductRating.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the rating summary of {total} product(s)."))
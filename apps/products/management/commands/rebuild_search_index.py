@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the product search index from all active products. "
+            "Run it after renaming categories or tags, or editing products outside the API")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=500,
+            help="Number of products indexed per batch. Defaults to 500"
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_index(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} product(s)."))
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+STAR_FIELDS = {
+    1: "one_star_count",
+    2: "two_star_count",
+    3: "three_star_count",
+    4: "four_star_count",
+    5: "five_star_count",
+}
+
+
+def build_rating_summaries(apps, schema_editor):
+    """build the rating summary of the products that already have reviews"""
+    Review = apps.get_model("reviews", "Review")
+    ProductRating = apps.get_model("products", "ProductRating")
+    annotations = {
+        "rating_sum": Sum("rating"),
+        "rating_count": Count("id"),
+    }
+    for star, field in STAR_FIELDS.items():
+        annotations[field] = Count("id", filter=Q(rating=star))
+    rows = Review.objects.order_by().values("product_id").annotate(**annotations)
+    ProductRating.objects.bulk_create(
+        [ProductRating(**row) for row in rows.iterator()], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_alter_product_min_order_quantity'),
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRating',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to='products.product')),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('one_star_count', models.PositiveIntegerField(default=0)),
+                ('two_star_count', models.PositiveIntegerField(default=0)),
+                ('three_star_count', models.PositiveIntegerField(default=0)),
+                ('four_star_count', models.PositiveIntegerField(default=0)),
+                ('five_star_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Product Rating',
+                'verbose_name_plural': 'Product Ratings',
+            },
+        ),
+        migrations.RunPython(build_rating_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,126 @@
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import migrations
+
+# the text analysis of `apps.products.search` when the index was added,
+# frozen so later changes to the app code do not change this migration
+WORD_RE = re.compile(r"[^\W_]+")
+STOP_WORDS = frozenset([
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is",
+    "it", "of", "on", "or", "that", "the", "this", "to", "with",
+])
+MAX_WORD_LENGTH = 100
+FIELD_WEIGHTS = {
+    "name": 3,
+    "categories": 2,
+    "tags": 2,
+    "description": 1,
+}
+
+
+def tokenize(text):
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    return [
+        word for word in WORD_RE.findall(text)
+        if word not in STOP_WORDS and len(word) <= MAX_WORD_LENGTH
+    ]
+
+
+def stem(word):
+    if len(word) <= 3 or not word.isalpha():
+        return word
+    if word.endswith("sses"):
+        word = word[:-2]
+    elif word.endswith("ies") and len(word) > 4:
+        word = word[:-3] + "y"
+    elif word.endswith(("xes", "ches", "shes")):
+        word = word[:-2]
+    elif word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        word = word[:-1]
+
+    for suffix in ("ing", "ed"):
+        base = word[:-len(suffix)]
+        if word.endswith(suffix) and len(base) >= 3 and any(c in "aeiouy" for c in base):
+            word = base
+            if word[-1] == word[-2] and word[-1] not in "lsz":
+                word = word[:-1]
+            break
+
+    if word.endswith("ly") and len(word) > 5:
+        word = word[:-2]
+    return word
+
+
+def analyze_product(product):
+    fields = {
+        "name": product.name,
+        "categories": " ".join(category.name for category in product.categories.all()),
+        "tags": " ".join(tag.name for tag in product.tags.all()),
+        "description": product.description,
+    }
+    frequencies = Counter()
+    words = {}
+    for field, text in fields.items():
+        for word in tokenize(text):
+            term = stem(word)
+            frequencies[term] += FIELD_WEIGHTS[field]
+            words[word] = term
+    return frequencies, words
+
+
+def backfill_search_index(apps, schema_editor):
+    """index the active products that existed before the search index"""
+    Product = apps.get_model("products", "Product")
+    ProductSearchDocument = apps.get_model("products", "ProductSearchDocument")
+    ProductSearchPosting = apps.get_model("products", "ProductSearchPosting")
+    SearchTerm = apps.get_model("products", "SearchTerm")
+
+    indexed = ProductSearchDocument.objects.values("product_id")
+    products = (
+        Product.objects.filter(status="active").exclude(pk__in=indexed)
+        .prefetch_related("categories", "tags").order_by("pk")
+    )
+    batch = []
+    for product in products.iterator(chunk_size=500):
+        batch.append(product)
+        if len(batch) >= 500:
+            _write_batch(batch, ProductSearchDocument, ProductSearchPosting, SearchTerm)
+            batch = []
+    if batch:
+        _write_batch(batch, ProductSearchDocument, ProductSearchPosting, SearchTerm)
+
+
+def _write_batch(products, ProductSearchDocument, ProductSearchPosting, SearchTerm):
+    postings, documents, words = [], [], {}
+    for product in products:
+        frequencies, product_words = analyze_product(product)
+        length = sum(frequencies.values())
+        postings += [
+            ProductSearchPosting(
+                product_id=product.pk, term=term, frequency=frequency, document_length=length
+            )
+            for term, frequency in frequencies.items()
+        ]
+        documents.append(ProductSearchDocument(product_id=product.pk, length=length))
+        words.update(product_words)
+    ProductSearchPosting.objects.bulk_create(postings, batch_size=5000)
+    ProductSearchDocument.objects.bulk_create(documents)
+    SearchTerm.objects.bulk_create(
+        [SearchTerm(word=word, term=term) for word, term in words.items()],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_index, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,7 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Now
 from django.core.validators import MinValueValidator
 from django.conf import settings
 
@@ -100,10 +102,73 @@ class Product(models.Model):
         verbose_name = "Product"
         verbose_name_plural = "Products"
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "-created_at", "-id"], name="product_status_created_idx"),
+            models.Index(fields=["status", "type", "-created_at"], name="product_status_type_idx"),
+            models.Index(fields=["status", "price"], name="product_status_price_idx"),
+            models.Index(fields=["status", "stock_quantity"], name="product_status_stock_idx"),
+        ]
     
     def __str__(self):
         return f"[Product] {self.name}"
 
+    @classmethod
+    def decrement_stock(cls, quantities: dict):
+        """
+        Take the quantities (a dict of product id to quantity) from the stock
+        of the products and add them to their purchase count, in a single
+        conditional UPDATE, so a concurrent order can not oversell a product.
+        The rows are locked in a consistent order first on databases that
+        support it. Either every product is updated or none is: returns the ids
+        of the products without enough stock (empty when the stock was taken).
+        """
+        ids = sorted(quantities, key=str)
+        quantity = Case(
+            *[When(pk=pk, then=Value(quantities[pk])) for pk in ids],
+            output_field=models.PositiveIntegerField(),
+        )
+        available = Q()
+        for pk in ids:
+            available |= Q(pk=pk, stock_quantity__gte=quantities[pk])
+
+        with transaction.atomic():
+            stock = dict(
+                cls.objects.select_for_update().filter(pk__in=ids)
+                .order_by("pk").values_list("pk", "stock_quantity")
+            )
+            unavailable = [pk for pk in ids if stock.get(pk, 0) < quantities[pk]]
+            if unavailable:
+                return unavailable
+            updated = cls.objects.filter(available).update(
+                stock_quantity=F("stock_quantity") - quantity,
+                purchase_count=F("purchase_count") + quantity,
+                updated_at=Now(),
+            )
+            if updated != len(ids):
+                # the stock changed after it was read (no row locks)
+                transaction.set_rollback(True)
+                return ids
+        return []
+
+    @staticmethod
+    def prefetch_cover_image(lookup="images"):
+        """Prefetch only the cover image of products, in a single query
+        for all of them. `lookup` is the path to the products images from
+        the queryset being loaded (e.g `product__images` for cart items)"""
+        return models.Prefetch(lookup, queryset=ProductImage.objects.all()[:1], to_attr="cover_images")
+
+    @property
+    def cover_image(self):
+        """The first image of the product (the one displayed first). It is
+        read from the prefetched images when they have been loaded"""
+        if hasattr(self, "cover_images"):
+            images = self.cover_images
+        elif "images" in getattr(self, "_prefetched_objects_cache", {}):
+            images = self.images.all()
+        else:
+            return self.images.first()
+        return images[0] if images else None
+
 
 class ProductImage(models.Model):
     """
@@ -132,3 +197,184 @@ class ProductImage(models.Model):
     
     def __str__(self):
         return f"[Image] for Product: {self.product.name}"
+
+
+class ProductRating(models.Model):
+    """
+    Persisted rating summary of a product. Keeps the sum and count of
+    the ratings, and how many reviews gave each star, so reading the rating
+    of a product does not require scanning its reviews.
+    It is updated along with every review change and can be rebuilt
+    from the reviews with the `rebuild_product_ratings` command.
+    """
+    STAR_FIELDS = {
+        1: "one_star_count",
+        2: "two_star_count",
+        3: "three_star_count",
+        4: "four_star_count",
+        5: "five_star_count",
+    }
+
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name="rating_summary"
+    )
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    one_star_count = models.PositiveIntegerField(default=0)
+    two_star_count = models.PositiveIntegerField(default=0)
+    three_star_count = models.PositiveIntegerField(default=0)
+    four_star_count = models.PositiveIntegerField(default=0)
+    five_star_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Product Rating"
+        verbose_name_plural = "Product Ratings"
+
+    def __str__(self):
+        return f"[ProductRating] {self.average} ({self.rating_count}) for Product: {self.product_id}"
+
+    @property
+    def average(self):
+        """the average rating of the product"""
+        if not self.rating_count:
+            return 0
+        return self.rating_sum / self.rating_count
+
+    @property
+    def histogram(self):
+        """the number of reviews per star"""
+        return {star: getattr(self, field) for star, field in self.STAR_FIELDS.items()}
+
+    @classmethod
+    def summary_annotations(cls):
+        """the aggregates to compute a summary from the reviews of a product"""
+        annotations = {
+            "rating_sum": Sum("reviews__rating", default=0),
+            "rating_count": Count("reviews"),
+        }
+        for star, field in cls.STAR_FIELDS.items():
+            annotations[field] = Count("reviews", filter=Q(reviews__rating=star))
+        return annotations
+
+    @classmethod
+    def record(cls, product_id, added=None, removed=None):
+        """
+        Update the summary of a product when a review is created (`added`),
+        deleted (`removed`) or has its rating changed (both). The update is
+        done in the db with F expressions so concurrent reviews are not lost.
+        If the product has no summary yet, it is built from its reviews.
+        """
+        deltas = {"rating_sum": 0, "rating_count": 0}
+        if added:
+            deltas["rating_sum"] += added
+            deltas["rating_count"] += 1
+            deltas[cls.STAR_FIELDS[added]] = 1
+        if removed:
+            deltas["rating_sum"] -= removed
+            deltas["rating_count"] -= 1
+            field = cls.STAR_FIELDS[removed]
+            deltas[field] = deltas.get(field, 0) - 1
+
+        changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+        if not changes:
+            return
+        with transaction.atomic():
+            if not cls.objects.filter(product_id=product_id).update(**changes):
+                cls.rebuild(Product.objects.filter(pk=product_id))
+
+    @classmethod
+    def rebuild(cls, products=None, batch_size=1000):
+        """
+        Rebuild the summaries of the given products (all products by default)
+        from their reviews. The aggregates are computed in a single query
+        and written back in batches. Returns the number of summaries written.
+        """
+        products = Product.objects.all() if products is None else products
+        annotations = cls.summary_annotations()
+        fields = list(annotations)
+        rows = products.order_by().annotate(**annotations).values_list("pk", *fields)
+        total = 0
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(cls(product_id=row[0], **dict(zip(fields, row[1:]))))
+            if len(batch) >= batch_size:
+                total += cls._write_batch(batch, fields)
+                batch = []
+        if batch:
+            total += cls._write_batch(batch, fields)
+        return total
+
+    @classmethod
+    def _write_batch(cls, batch, fields):
+        cls.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=["product"],
+            update_fields=fields + ["updated_at"],
+        )
+        return len(batch)
+
+
+class ProductSearchDocument(models.Model):
+    """
+    A product in the search index. Holds the length of the indexed text
+    (in terms) used to normalize the BM25 score. Only active products
+    are indexed.
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name="search_document"
+    )
+    length = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Product Search Document"
+        verbose_name_plural = "Product Search Documents"
+
+    def __str__(self):
+        return f"[ProductSearchDocument] {self.length} term(s) for Product: {self.product_id}"
+
+
+class ProductSearchPosting(models.Model):
+    """
+    An entry of the inverted index: how many times a term appears in a product.
+    `document_length` repeats the length of the product's document so
+    postings can be scored without a join.
+    """
+    term = models.CharField(max_length=100)
+    frequency = models.PositiveIntegerField(default=1)
+    document_length = models.PositiveIntegerField(default=0)
+
+    # Relationship
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="search_postings")
+
+    class Meta:
+        verbose_name = "Product Search Posting"
+        verbose_name_plural = "Product Search Postings"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["term", "product"],
+                name="unique_search_term_per_product"
+            )
+        ]
+
+    def __str__(self):
+        return f"[ProductSearchPosting] {self.term} x {self.frequency} for Product: {self.product_id}"
+
+
+class SearchTerm(models.Model):
+    """
+    The vocabulary of the search index. Maps every indexed word to the
+    term (stem) it was indexed under, so a partially typed word can be
+    matched against the words that start with it.
+    """
+    word = models.CharField(max_length=100, unique=True)
+    term = models.CharField(max_length=100)
+
+    class Meta:
+        verbose_name = "Search Term"
+        verbose_name_plural = "Search Terms"
+
+    def __str__(self):
+        return f"[SearchTerm] {self.word} -> {self.term}"
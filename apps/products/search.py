@@ -0,0 +1,285 @@
+"""
+Full text search on products, backed by an inverted index stored in the
+database (`ProductSearchPosting`), so it runs on any database backend and
+does not need an external search service.
+
+- Text is split into words, lower cased and stripped of accents and
+  stop words, then reduced to a term with a light suffix stripping stemmer
+  (`shoes` and `shoe` are the same term, `running` and `run` too).
+- A product is indexed from its name, categories, tags and description.
+  Words in the name count more than words in the other fields.
+- Results are ranked with BM25, computed by the database.
+- The last word of a query is also matched as a prefix (unless the query
+  ends with a space), so the endpoint can be used for autocomplete.
+
+The index is updated when a product is created or updated through the
+`ProductSerializer` and can be rebuilt with the `rebuild_search_index`
+command. Words no product is indexed under anymore are removed from the
+vocabulary. The search stats are cached in the catalog cache
+(`CATALOG_CACHE_ALIAS`).
+"""
+import math
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import (Avg, Case, Count, ExpressionWrapper, F, FloatField,
+                              Max, Sum, Value, When)
+from django.db.models.functions import Length
+
+from .cache import get_cache
+from .models import Product, ProductSearchDocument, ProductSearchPosting, SearchTerm
+
+
+WORD_RE = re.compile(r"[^\W_]+")
+STOP_WORDS = frozenset([
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is",
+    "it", "of", "on", "or", "that", "the", "this", "to", "with",
+])
+MAX_WORD_LENGTH = 100
+
+FIELD_WEIGHTS = {
+    "name": 3,
+    "categories": 2,
+    "tags": 2,
+    "description": 1,
+}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+PREFIX_EXPANSIONS = 10
+"""the max number of indexed words a partially typed word can expand to.
+The shortest words are used, as they are the closest completions"""
+
+STATS_CACHE_KEY = "products:search:stats"
+STATS_CACHE_TIMEOUT = 60
+
+
+def tokenize(text: str):
+    """split a text into lower cased words without accents and stop words"""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    return [
+        word for word in WORD_RE.findall(text)
+        if word not in STOP_WORDS and len(word) <= MAX_WORD_LENGTH
+    ]
+
+
+def stem(word: str):
+    """reduce a word to its term by stripping common english suffixes"""
+    if len(word) <= 3 or not word.isalpha():
+        return word
+    if word.endswith("sses"):
+        word = word[:-2]
+    elif word.endswith("ies") and len(word) > 4:
+        word = word[:-3] + "y"
+    elif word.endswith(("xes", "ches", "shes")):
+        word = word[:-2]
+    elif word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        word = word[:-1]
+
+    for suffix in ("ing", "ed"):
+        base = word[:-len(suffix)]
+        if word.endswith(suffix) and len(base) >= 3 and any(c in "aeiouy" for c in base):
+            word = base
+            if word[-1] == word[-2] and word[-1] not in "lsz":
+                word = word[:-1] # running -> run
+            break
+
+    if word.endswith("ly") and len(word) > 5:
+        word = word[:-2]
+    return word
+
+
+def analyze_product(product: Product):
+    """return the weighted frequency of each term of a product and
+    the words indexed under each term"""
+    fields = {
+        "name": product.name,
+        "categories": " ".join(category.name for category in product.categories.all()),
+        "tags": " ".join(tag.name for tag in product.tags.all()),
+        "description": product.description,
+    }
+    frequencies = Counter()
+    words = {}
+    for field, text in fields.items():
+        for word in tokenize(text):
+            term = stem(word)
+            frequencies[term] += FIELD_WEIGHTS[field]
+            words[word] = term
+    return frequencies, words
+
+
+def _index_rows(products):
+    """build the postings, documents and words of the given products"""
+    postings, documents, words = [], [], {}
+    for product in products:
+        frequencies, product_words = analyze_product(product)
+        length = sum(frequencies.values())
+        postings += [
+            ProductSearchPosting(
+                product_id=product.pk, term=term, frequency=frequency, document_length=length
+            )
+            for term, frequency in frequencies.items()
+        ]
+        documents.append(ProductSearchDocument(product_id=product.pk, length=length))
+        words.update(product_words)
+    return postings, documents, words
+
+
+def _save_words(words: dict, batch_size=1000):
+    SearchTerm.objects.bulk_create(
+        [SearchTerm(word=word, term=term) for word, term in words.items()],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+
+
+def index_product(product: Product):
+    """
+    Add or update a product in the index. Products that are not
+    active (draft or archived) are removed from the index instead.
+    """
+    with transaction.atomic():
+        postings = ProductSearchPosting.objects.filter(product_id=product.pk)
+        previous_terms = set(postings.values_list("term", flat=True))
+        postings.delete()
+        if product.status != Product.ProductStatus.active:
+            ProductSearchDocument.objects.filter(product_id=product.pk).delete()
+        else:
+            postings, documents, words = _index_rows([product])
+            ProductSearchPosting.objects.bulk_create(postings)
+            ProductSearchDocument.objects.update_or_create(
+                product_id=product.pk, defaults={"length": documents[0].length}
+            )
+            _save_words(words)
+        prune_terms(previous_terms)
+    get_cache().delete(STATS_CACHE_KEY)
+
+
+def prune_terms(terms):
+    """remove the words of the terms no product is indexed under anymore"""
+    if not terms:
+        return
+    used = ProductSearchPosting.objects.filter(term__in=terms).values("term")
+    SearchTerm.objects.filter(term__in=terms).exclude(term__in=used).delete()
+
+
+def rebuild_index(batch_size=500):
+    """drop the index and build it again from all active products.
+    Returns the number of products indexed"""
+    products = (
+        Product.objects.filter(status=Product.ProductStatus.active)
+        .prefetch_related("categories", "tags")
+        .order_by("pk")
+    )
+    total = 0
+    with transaction.atomic():
+        ProductSearchPosting.objects.all().delete()
+        ProductSearchDocument.objects.all().delete()
+        SearchTerm.objects.all().delete()
+
+        batch = []
+        for product in products.iterator(chunk_size=batch_size):
+            batch.append(product)
+            if len(batch) >= batch_size:
+                total += _write_batch(batch, batch_size)
+                batch = []
+        if batch:
+            total += _write_batch(batch, batch_size)
+    get_cache().delete(STATS_CACHE_KEY)
+    return total
+
+
+def _write_batch(products, batch_size):
+    postings, documents, words = _index_rows(products)
+    ProductSearchPosting.objects.bulk_create(postings, batch_size=batch_size * 10)
+    ProductSearchDocument.objects.bulk_create(documents, batch_size=batch_size)
+    _save_words(words)
+    return len(products)
+
+
+def _get_stats():
+    """return the number of indexed products and their average length"""
+    cache = get_cache()
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        result = ProductSearchDocument.objects.aggregate(count=Count("pk"), avg=Avg("length"))
+        stats = (result["count"], result["avg"] or 0)
+        cache.set(STATS_CACHE_KEY, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def _bm25(idf: dict, average_length):
+    """the BM25 score of a posting, as a db expression. `idf` maps
+    each term to its inverse document frequency"""
+    frequency = F("frequency")
+    norm = Value(1 - B) + Value(B / (average_length or 1)) * F("document_length")
+    term_idf = Case(
+        *[When(term=term, then=Value(value)) for term, value in idf.items()],
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return ExpressionWrapper(
+        term_idf * frequency * Value(K1 + 1) / (frequency + Value(K1) * norm),
+        output_field=FloatField(),
+    )
+
+
+def search(query: str, limit=20):
+    """
+    Return the ids and scores of the products that best match the query,
+    best match first. Every term of the query adds its BM25 score; the
+    words a partially typed last word expands to count as a single term
+    (the best matching one is used).
+    The scores are computed and ranked by the database in one grouped
+    query, so only the top `limit` rows are returned to python.
+    """
+    words = tokenize(query)
+    if not words:
+        return []
+
+    prefix = None
+    if not query[-1].isspace():
+        prefix = words.pop()
+    terms = {stem(word) for word in words}
+
+    prefix_terms = set()
+    if prefix:
+        prefix_terms = set(
+            SearchTerm.objects.filter(word__startswith=prefix)
+            .annotate(word_length=Length("word"))
+            .order_by("word_length", "word")
+            .values_list("term", flat=True)[:PREFIX_EXPANSIONS]
+        )
+        prefix_terms.add(stem(prefix))
+        prefix_terms -= terms
+
+    postings = ProductSearchPosting.objects.filter(term__in=terms | prefix_terms).order_by()
+    document_frequency = dict(postings.values_list("term").annotate(Count("pk")))
+    if not document_frequency:
+        return []
+
+    count, average_length = _get_stats()
+    idf = {
+        term: math.log(1 + (count - df + 0.5) / (df + 0.5))
+        for term, df in document_frequency.items()
+    }
+    score = Value(0.0)
+    exact_idf = {term: value for term, value in idf.items() if term in terms}
+    if exact_idf:
+        score = score + Sum(_bm25(exact_idf, average_length))
+    prefix_idf = {term: value for term, value in idf.items() if term in prefix_terms}
+    if prefix_idf:
+        score = score + Max(_bm25(prefix_idf, average_length))
+
+    results = (
+        postings.values("product_id")
+        .annotate(score=ExpressionWrapper(score, output_field=FloatField()))
+        .order_by("-score", "product_id")
+        .values_list("product_id", "score")[:limit]
+    )
+    return list(results)
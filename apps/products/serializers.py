@@ -3,10 +3,11 @@ import uuid
 from PIL import Image
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from django.db.models import Avg
+from django.core.exceptions import ObjectDoesNotExist
 
 from common.utils.custom_exceptions import ServiceUnavailable
-from .models import Product, Category, Tag, ProductImage
+from .models import Product, Category, Tag, ProductImage, ProductRating
+from .search import index_product
 
 
 # TODO: add serializers to create Categories and Tags
@@ -63,6 +64,7 @@ class ProductSerializer(serializers.ModelSerializer):
     )
     images = ProductImageSerializer(many=True, required=False)
     rating = serializers.SerializerMethodField()
+    rating_breakdown = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
@@ -71,6 +73,7 @@ class ProductSerializer(serializers.ModelSerializer):
             "name",
             "description",
             "rating",
+            "rating_breakdown",
             "price",
             "stock_quantity",
             "min_order_quantity",
@@ -94,6 +97,7 @@ class ProductSerializer(serializers.ModelSerializer):
         if images:
             for image_dict in images:
                 ProductImage.objects.create(product=product, **image_dict)
+        index_product(product)
         return product
     
     def update(self, instance, validated_data):
@@ -107,13 +111,28 @@ class ProductSerializer(serializers.ModelSerializer):
         if images:
             for image_dict in images:
                 ProductImage.objects.create(product=product, **image_dict)
+        index_product(product) # archived and draft products are removed from the index
         return product
     
     def get_rating(self, instance):
-        """get the aggregate rating on the product"""
-        average_rating = instance.reviews.aggregate(avg=Avg("rating"))["avg"] or 0
-        review_count = instance.reviews.count()
-        return f"{average_rating} ({review_count})"
+        """get the aggregate rating on the product from its rating summary"""
+        summary = self._get_rating_summary(instance)
+        if summary is None:
+            return "0 (0)"
+        return f"{summary.average} ({summary.rating_count})"
+
+    def get_rating_breakdown(self, instance):
+        """get the number of reviews per star"""
+        summary = self._get_rating_summary(instance)
+        if summary is None:
+            return {star: 0 for star in ProductRating.STAR_FIELDS}
+        return summary.histogram
+
+    def _get_rating_summary(self, instance):
+        try:
+            return instance.rating_summary
+        except ObjectDoesNotExist:
+            return None
 
 
 class MinimalProductSerializer(serializers.ModelSerializer):
@@ -136,9 +155,14 @@ class MinimalProductSerializer(serializers.ModelSerializer):
 
     def get_image(self, obj: Product):
         """return the first image for cart/order item display"""
-        image: ProductImage = obj.images.first()
+        image: ProductImage = obj.cover_image
         return image.image_url if image else None
     
     def get_in_stock(self, obj: Product):
         return True if obj.stock_quantity > 0 else False
 
+
+class ProductSearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(required=True, max_length=200)
+    limit = serializers.IntegerField(required=False, default=20, min_value=1, max_value=50)
+
@@ -0,0 +1,75 @@
+"""Invalidate the cached catalog data when the catalog changes"""
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save, m2m_changed
+from django.dispatch import receiver
+
+from .cache import invalidate_categories, invalidate_products
+from .models import Product, ProductImage, Category, Tag
+
+
+@receiver(post_save, sender=Product)
+def invalidate_product_on_save(sender, instance, **kwargs):
+    invalidate_products([instance.pk])
+
+
+@receiver(pre_delete, sender=Product)
+def invalidate_product_on_delete(sender, instance, **kwargs):
+    """the categories are looked up before the product is deleted"""
+    invalidate_products([instance.pk])
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_product_on_image_change(sender, instance, **kwargs):
+    invalidate_products([instance.product_id])
+
+
+@receiver(pre_save, sender=Category)
+def remember_category_name(sender, instance, **kwargs):
+    """keep the name the category is saved under, to invalidate it if the category is renamed"""
+    instance._previous_name = (
+        Category.objects.filter(pk=instance.pk).values_list("name", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def invalidate_category_on_change(sender, instance, **kwargs):
+    """the category name is rendered on each of its products. The product
+    lists of both names are invalidated when the category is renamed"""
+    names = {instance.name, getattr(instance, "_previous_name", None)} - {None}
+    product_ids = instance.products.values_list("pk", flat=True)
+    invalidate_categories(names, product_ids)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def invalidate_tag_on_change(sender, instance, **kwargs):
+    """the tag name is rendered on each of its products"""
+    product_ids = list(instance.products.values_list("pk", flat=True))
+    invalidate_products(product_ids)
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def invalidate_on_category_relation_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """invalidate the products and the categories they were added to or removed from"""
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if reverse:
+        product_ids = pk_set if pk_set is not None else instance.products.values_list("pk", flat=True)
+        invalidate_categories([instance.name], list(product_ids))
+    else:
+        categories = instance.categories.all()
+        if pk_set is not None:
+            categories = Category.objects.filter(pk__in=pk_set)
+        invalidate_products([instance.pk], list(categories.values_list("name", flat=True)))
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def invalidate_on_tag_relation_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if reverse:
+        product_ids = pk_set if pk_set is not None else instance.products.values_list("pk", flat=True)
+        invalidate_products(list(product_ids))
+    else:
+        invalidate_products([instance.pk])
@@ -1,3 +1,532 @@
-from django.test import TestCase
+from importlib import import_module
+from io import StringIO
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse_lazy
+from rest_framework import status
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from apps.accounts.models import User
+from apps.reviews.models import Review
+from .models import (Product, Category, Tag, ProductImage, ProductRating, ProductSearchDocument,
+                     ProductSearchPosting, SearchTerm)
+from .cache import get_catalog_version
+from .facets import compute_facets
+from .search import index_product, rebuild_index, search, stem, tokenize
+
+
+def create_product(name, categories=(), tags=(), **kwargs):
+    """create a product linked to the given categories and tags"""
+    data = {
+        "name": name,
+        "description": f"{name} description",
+        "price": 1000,
+        "stock_quantity": 20,
+    }
+    data.update(kwargs)
+    product = Product.objects.create(**data)
+    product.categories.set(categories)
+    product.tags.set(tags)
+    return product
+
+
+@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+class ProductListQueryTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.category = Category.objects.create(name="shoes")
+        cls.tag = Tag.objects.create(name="new")
+        cls.users = [
+            User.objects.create_user(
+                email=f"user{i}@test.com",
+                password="testpassword",
+                first_name="test",
+                last_name="user",
+            )
+            for i in range(2)
+        ]
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse_lazy("product-list")
+
+    def add_products(self, count):
+        """add `count` products, each with an image and a review per user"""
+        for _ in range(count):
+            index = Product.objects.count()
+            product = create_product(f"product {index}", [self.category], [self.tag])
+            ProductImage.objects.create(
+                product=product,
+                image_url=f"https://img.test/{index}.png",
+                position=index + 1,
+            )
+            for rating, user in enumerate(self.users, start=4):
+                Review.objects.create(product=product, user=user, rating=rating)
+        ProductRating.rebuild()
+
+    def test_list_query_count_is_constant(self):
+        """one query for the products and their rating summary, one per prefetched relation"""
+        self.add_products(12)
+        for page_size in [2, 10]:
+            with self.assertNumQueries(4):
+                response = self.client.get(self.url, {"page_size": page_size})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data["data"]["results"]), page_size)
+
+    def test_list_rating(self):
+        self.add_products(1)
+        response = self.client.get(self.url)
+        product = response.data["data"]["results"][0]
+        self.assertEqual(product["rating"], "4.5 (2)")
+        self.assertEqual(product["rating_breakdown"], {1: 0, 2: 0, 3: 0, 4: 1, 5: 1})
+        self.assertEqual(product["categories"], ["shoes"])
+        self.assertEqual(product["tags"], ["new"])
+        self.assertEqual(len(product["images"]), 1)
+
+    def test_retrieve_rating(self):
+        self.add_products(1)
+        product = Product.objects.get()
+        url = reverse_lazy("product-detail", kwargs={"pk": product.pk})
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["data"]["rating"], "4.5 (2)")
+
+    def test_rating_without_reviews(self):
+        create_product("no reviews", [self.category])
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["data"]["results"][0]["rating"], "0 (0)")
+
+
+class ProductListFilterTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.shoes = Category.objects.create(name="shoes")
+        cls.bags = Category.objects.create(name="bags")
+        cls.sale = Tag.objects.create(name="sale")
+        cls.sneaker = create_product("sneaker", [cls.shoes], [cls.sale], price=5000)
+        cls.boot = create_product("boot", [cls.shoes], price=15000, stock_quantity=0)
+        cls.tote = create_product("tote", [cls.shoes, cls.bags], [cls.sale], price=8000)
+        cls.ebook = create_product("ebook", [cls.bags], price=2000, type=Product.ProductType.DIGITAL)
+        create_product("draft", [cls.shoes], status=Product.ProductStatus.draft)
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse_lazy("product-list")
+
+    def get_names(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {i["name"] for i in response.data["data"]["results"]}
+
+    def test_filter_category(self):
+        self.assertEqual(self.get_names({"category": "shoes"}), {"sneaker", "boot", "tote"})
+        self.assertEqual(self.get_names({"category": "shoes,bags"}), {"sneaker", "boot", "tote", "ebook"})
+
+    def test_filter_tag(self):
+        self.assertEqual(self.get_names({"tag": "sale"}), {"sneaker", "tote"})
+
+    def test_filter_type(self):
+        self.assertEqual(self.get_names({"type": "digital"}), {"ebook"})
+
+    def test_filter_price_range(self):
+        self.assertEqual(self.get_names({"min_price": 3000, "max_price": 9000}), {"sneaker", "tote"})
+
+    def test_filter_in_stock(self):
+        self.assertEqual(self.get_names({"in_stock": "true"}), {"sneaker", "tote", "ebook"})
+        self.assertEqual(self.get_names({"in_stock": "false"}), {"boot"})
+
+    def test_cursor_pagination(self):
+        """walking the cursor returns every active product once, newest first"""
+        names = []
+        params = {"page_size": 3}
+        url = self.url
+        while url:
+            response = self.client.get(url, params)
+            names += [i["name"] for i in response.data["data"]["results"]]
+            url, params = response.data["data"]["next"], None
+        self.assertEqual(names, ["ebook", "tote", "boot", "sneaker"])
+
+
+class ProductRatingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.product = create_product("rated")
+        cls.users = [
+            User.objects.create_user(
+                email=f"user{i}@test.com",
+                password="testpassword",
+                first_name="test",
+                last_name="user",
+            )
+            for i in range(3)
+        ]
+
+    def test_record(self):
+        ProductRating.objects.create(product=self.product)
+        ProductRating.record(self.product.pk, added=5)
+        ProductRating.record(self.product.pk, added=3)
+        ProductRating.record(self.product.pk, added=4, removed=5)
+        summary = ProductRating.objects.get(product=self.product)
+        self.assertEqual(summary.rating_sum, 7)
+        self.assertEqual(summary.rating_count, 2)
+        self.assertEqual(summary.histogram, {1: 0, 2: 0, 3: 1, 4: 1, 5: 0})
+        self.assertEqual(summary.average, 3.5)
+
+    def test_record_builds_missing_summary_from_reviews(self):
+        """the first change on a product without summary counts its existing reviews"""
+        for rating, user in zip([2, 4], self.users):
+            Review.objects.create(product=self.product, user=user, rating=rating)
+        review = Review.objects.create(product=self.product, user=self.users[2], rating=5)
+        ProductRating.record(self.product.pk, added=review.rating)
+        summary = ProductRating.objects.get(product=self.product)
+        self.assertEqual(summary.rating_count, 3)
+        self.assertEqual(summary.rating_sum, 11)
+
+    def test_rebuild_command(self):
+        other = create_product("not rated")
+        ProductRating.objects.create(product=other, rating_sum=10, rating_count=2, five_star_count=2)
+        for rating, user in zip([1, 5, 5], self.users):
+            Review.objects.create(product=self.product, user=user, rating=rating)
+        call_command("rebuild_product_ratings", stdout=StringIO())
+        summary = ProductRating.objects.get(product=self.product)
+        self.assertEqual(summary.rating_count, 3)
+        self.assertEqual(summary.histogram, {1: 1, 2: 0, 3: 0, 4: 0, 5: 2})
+        other_summary = ProductRating.objects.get(product=other)
+        self.assertEqual(other_summary.rating_count, 0)
+        self.assertEqual(other_summary.five_star_count, 0)
+
+
+@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+class ProductSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.shoes = Category.objects.create(name="shoes")
+        cls.admin = User.objects.create_superuser(
+            email="admin@test.com",
+            password="testpassword",
+            first_name="admin",
+            last_name="user",
+        )
+        cls.runner = create_product(
+            "Running Shoes", [cls.shoes], description="Light shoes for road running"
+        )
+        cls.boot = create_product("Leather Boot", [cls.shoes], description="A warm boot for winter")
+        cls.bag = create_product("Canvas Bag", description="Carry your running gear")
+        create_product("Hidden Shoe", [cls.shoes], description="draft", status=Product.ProductStatus.draft)
+        rebuild_index()
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse_lazy("product-search")
+
+    def test_tokenize_and_stem(self):
+        self.assertEqual(tokenize("The Café, and SHOES!"), ["cafe", "shoes"])
+        self.assertEqual(stem("shoes"), "shoe")
+        self.assertEqual(stem("running"), "run")
+        self.assertEqual(stem("boxes"), "box")
+        self.assertEqual(stem("batteries"), "battery")
+
+    def test_rank(self):
+        """the name weighs more than the description"""
+        results = search("running ")
+        self.assertEqual([i for i, _ in results], [self.runner.pk, self.bag.pk])
+
+    def test_prefix(self):
+        results = search("leath")
+        self.assertEqual([i for i, _ in results], [self.boot.pk])
+        self.assertEqual(search("leath "), [])
+
+    def test_category_and_draft(self):
+        """products are found by category, drafts are not indexed"""
+        self.assertEqual({i for i, _ in search("shoe ")}, {self.runner.pk, self.boot.pk})
+
+    def test_unused_words_pruned(self):
+        self.bag.name = "Canvas Tote"
+        self.bag.save()
+        index_product(self.bag)
+        self.assertFalse(SearchTerm.objects.filter(word="bag").exists())
+        self.assertTrue(SearchTerm.objects.filter(word="tote").exists())
+        self.assertTrue(SearchTerm.objects.filter(word="running").exists()) # still used by others
+
+    def test_backfill_migration(self):
+        """products that existed before the index are indexed by the migration"""
+        migration = import_module("apps.products.migrations.0008_backfill_search_index")
+        ProductSearchPosting.objects.filter(product=self.boot).delete()
+        ProductSearchDocument.objects.filter(product=self.boot).delete()
+        migration.backfill_search_index(django_apps, None)
+        self.assertEqual([i for i, _ in search("warm boot")], [self.boot.pk])
+        self.assertEqual(ProductSearchDocument.objects.count(), 3)
+
+    def test_search_endpoint(self):
+        response = self.client.get(self.url, {"q": "warm boot"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([i["name"] for i in response.data["data"]], ["Leather Boot"])
+
+    def test_search_endpoint_requires_query(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_index_updated_through_serializer(self):
+        """creating, renaming and archiving a product through the API updates the index"""
+        self.client.force_authenticate(user=self.admin)
+        data = {
+            "name": "Rain Jacket",
+            "description": "Waterproof",
+            "price": 100,
+            "stock_quantity": 5,
+            "categories": ["shoes"],
+            "tags": [],
+        }
+        response = self.client.post(reverse_lazy("product-list"), data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        product_id = Product.objects.get(name="Rain Jacket").pk
+        self.assertEqual([i for i, _ in search("jacket")], [product_id])
+
+        url = reverse_lazy("product-detail", kwargs={"pk": product_id})
+        self.client.patch(url, {"name": "Rain Coat"}, format="json")
+        self.assertEqual(search("jacket"), [])
+        self.assertEqual([i for i, _ in search("coat")], [product_id])
+
+        self.client.patch(url, {"status": "archived"}, format="json")
+        self.assertEqual(search("coat"), [])
+        self.assertFalse(ProductSearchPosting.objects.filter(product_id=product_id).exists())
+
+    def test_rebuild_command(self):
+        Product.objects.filter(pk=self.bag.pk).update(name="Canvas Tote")
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual([i for i, _ in search("tote")], [self.bag.pk])
+
+
+@override_settings(PRODUCT_PRICE_FACET_BUCKETS=[5000, 10000])
+class ProductFacetsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.shoes = Category.objects.create(name="shoes")
+        cls.bags = Category.objects.create(name="bags")
+        cls.sale = Tag.objects.create(name="sale")
+        create_product("sneaker", [cls.shoes], [cls.sale], price=4000)
+        create_product("boot", [cls.shoes], price=15000)
+        create_product("tote", [cls.shoes, cls.bags], [cls.sale], price=8000)
+        create_product("ebook", [cls.bags], price=2000, type=Product.ProductType.DIGITAL)
+        create_product("draft", [cls.shoes], status=Product.ProductStatus.draft)
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse_lazy("product-facets")
+
+    def test_compute_facets_in_one_query(self):
+        queryset = Product.objects.filter(status=Product.ProductStatus.active)
+        with self.assertNumQueries(1):
+            facets = compute_facets(queryset)
+        self.assertEqual(facets["categories"], [
+            {"value": "shoes", "count": 3}, {"value": "bags", "count": 2}
+        ])
+        self.assertEqual(facets["tags"], [{"value": "sale", "count": 2}])
+        self.assertEqual(facets["types"], [
+            {"value": "physical", "count": 3}, {"value": "digital", "count": 1}
+        ])
+        self.assertEqual(facets["price_ranges"], [
+            {"min_price": 0, "max_price": 5000, "count": 2},
+            {"min_price": 5000, "max_price": 10000, "count": 1},
+            {"min_price": 10000, "max_price": None, "count": 1},
+        ])
+
+    def test_facets_endpoint_filtered(self):
+        response = self.client.get(self.url, {"tag": "sale"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data["data"]
+        self.assertEqual(data["categories"], [
+            {"value": "shoes", "count": 2}, {"value": "bags", "count": 1}
+        ])
+        self.assertEqual(data["types"], [{"value": "physical", "count": 2}])
+
+    def test_facets_cached_until_catalog_changes(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data["data"]["tags"], [{"value": "sale", "count": 2}])
+
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(name="boot").tags.add(self.sale)
+        self.assertGreater(get_catalog_version(), version)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["data"]["tags"], [{"value": "sale", "count": 3}])
+
+
+@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+class ProductResponseCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.shoes = Category.objects.create(name="shoes")
+        cls.bags = Category.objects.create(name="bags")
+        cls.sneaker = create_product("sneaker", [cls.shoes])
+        cls.tote = create_product("tote", [cls.bags])
+        cls.admin = User.objects.create_superuser(
+            email="admin@test.com",
+            password="testpassword",
+            first_name="admin",
+            last_name="user",
+        )
+        cls.user = User.objects.create_user(
+            email="user@test.com",
+            password="testpassword",
+            first_name="test",
+            last_name="user",
+        )
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.list_url = reverse_lazy("product-list")
+        self.detail_url = reverse_lazy("product-detail", kwargs={"pk": self.sneaker.pk})
+
+    def test_list_and_detail_cached(self):
+        self.client.get(self.list_url)
+        self.client.get(self.detail_url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.list_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["data"]["results"]), 2)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.detail_url)
+        self.assertEqual(response.data["data"]["name"], "sneaker")
+
+    def test_admin_bypasses_cache(self):
+        self.client.get(self.list_url)
+        self.client.force_authenticate(user=self.admin)
+        create_product("draft", status=Product.ProductStatus.draft)
+        response = self.client.get(self.list_url)
+        self.assertEqual(len(response.data["data"]["results"]), 3)
+
+    def test_product_change_invalidates(self):
+        self.client.get(self.list_url)
+        self.client.get(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sneaker.name = "runner"
+            self.sneaker.save()
+        self.assertEqual(self.client.get(self.detail_url).data["data"]["name"], "runner")
+        names = [i["name"] for i in self.client.get(self.list_url).data["data"]["results"]]
+        self.assertIn("runner", names)
+
+    def test_image_change_invalidates_detail(self):
+        self.client.get(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(product=self.sneaker, image_url="https://img.test/1.png")
+        self.assertEqual(len(self.client.get(self.detail_url).data["data"]["images"]), 1)
+
+    def test_review_invalidates_rating(self):
+        self.client.get(self.detail_url)
+        self.client.force_authenticate(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse_lazy("review-list"), {"product": self.sneaker.pk, "rating": 5}, format="json"
+            )
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(self.detail_url).data["data"]["rating"], "5.0 (1)")
+
+    def test_category_list_invalidated_by_its_products_only(self):
+        self.client.get(self.list_url, {"category": "shoes"})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tote.name = "big tote"
+            self.tote.save()
+        with self.assertNumQueries(0):
+            self.client.get(self.list_url, {"category": "shoes"})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tote.categories.add(self.shoes)
+        response = self.client.get(self.list_url, {"category": "shoes"})
+        self.assertEqual(len(response.data["data"]["results"]), 2)
+
+    def test_category_rename_invalidates_its_products(self):
+        self.client.get(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shoes.name = "footwear"
+            self.shoes.save()
+        self.assertEqual(self.client.get(self.detail_url).data["data"]["categories"], ["footwear"])
+
+    def test_category_rename_invalidates_old_name_list(self):
+        self.client.get(self.list_url, {"category": "shoes"})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shoes.name = "footwear"
+            self.shoes.save()
+        response = self.client.get(self.list_url, {"category": "shoes"})
+        self.assertEqual(response.data["data"]["results"], [])
+
+
+@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+class ProductConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.sneaker = create_product("sneaker")
+        cls.admin = User.objects.create_superuser(
+            email="admin@test.com",
+            password="testpassword",
+            first_name="admin",
+            last_name="user",
+        )
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.list_url = reverse_lazy("product-list")
+        self.detail_url = reverse_lazy("product-detail", kwargs={"pk": self.sneaker.pk})
+
+    def test_not_modified(self):
+        for url in (self.list_url, self.detail_url):
+            etag = self.client.get(url)["ETag"]
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response["ETag"], etag)
+
+    def test_etag_changes_with_product(self):
+        etag = self.client.get(self.detail_url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sneaker.name = "runner"
+            self.sneaker.save()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_admin_validators(self):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(self.list_url)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertNotIn("Last-Modified", response)
+        etag = response["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product("draft", status=Product.ProductStatus.draft)
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_admin_etag_changes_with_relations(self):
+        """categories, tags and images are rendered on the products"""
+        self.client.force_authenticate(user=self.admin)
+        category = Category.objects.create(name="running")
+        image = ProductImage.objects.create(product=self.sneaker, image_url="https://img.test/1.png")
+
+        def rename_category():
+            category.name = "trail"
+            category.save()
+
+        for change in (
+            lambda: self.sneaker.categories.add(category),
+            rename_category,
+            image.delete,
+        ):
+            etag = self.client.get(self.detail_url)["ETag"]
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -1,12 +1,15 @@
 from django.urls import path
 from drf_spectacular.utils import extend_schema, extend_schema_view
 
+from .serializers import ProductSearchQuerySerializer
 from .views import ProductViewSet
 
 ProductViewSet = extend_schema_view(
     list=extend_schema(tags=["Products"]),
     create=extend_schema(tags=["Products"]),
     retrieve=extend_schema(tags=["Products"]),
+    search=extend_schema(tags=["Products"], parameters=[ProductSearchQuerySerializer]),
+    facets=extend_schema(tags=["Products"]),
     partial_update=extend_schema(tags=["Products"]),
     destroy=extend_schema(tags=["Products"]),
 )(ProductViewSet)
@@ -14,11 +17,19 @@ ProductViewSet = extend_schema_view(
 product_list = ProductViewSet.as_view({
     "get": "list", "post": "create"
 })
+product_search = ProductViewSet.as_view({
+    "get": "search"
+})
+product_facets = ProductViewSet.as_view({
+    "get": "facets"
+})
 product_detail = ProductViewSet.as_view({
     "get": "retrieve", "patch": "partial_update", "delete": "destroy"
 })
 
 urlpatterns = [
     path("", product_list, name="product-list"),
+    path("search/", product_search, name="product-search"),
+    path("facets/", product_facets, name="product-facets"),
     path("<uuid:pk>/", product_detail, name="product-detail")
 ]
@@ -1,9 +1,16 @@
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 
-from common.utils.responses import customize_response
+from common.utils.conditional import conditional_response, make_etag
+from common.utils.pagination import CreatedAtCursorPagination
+from common.utils.responses import customize_response, success_response
+from .cache import cached_response, get_catalog_version, make_cache_key
+from .facets import get_facets
+from .filters import ProductFilter
 from .models import Product, ProductImage
-from .serializers import ProductSerializer, ProductImageSerializer
+from .search import search as search_products
+from .serializers import ProductSerializer, ProductImageSerializer, ProductSearchQuerySerializer
 
 
 class ProductViewSet(ModelViewSet):
@@ -11,6 +18,9 @@ class ProductViewSet(ModelViewSet):
     queryset = Product.objects.filter(status=Product.ProductStatus.active)
     permission_classes = [IsAuthenticated, IsAdminUser]
     http_method_names = ["get", "post", "patch", "delete"]
+    pagination_class = CreatedAtCursorPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ProductFilter
 
     def get_permissions(self):
         """return view permissions.
@@ -20,6 +30,8 @@ class ProductViewSet(ModelViewSet):
         action_permission = {
             "list": [AllowAny],
             "retrieve": [AllowAny],
+            "search": [AllowAny],
+            "facets": [AllowAny],
         }
         self.permission_classes = action_permission.get(
             self.action, self.permission_classes
@@ -29,20 +41,98 @@ class ProductViewSet(ModelViewSet):
     def get_queryset(self):
         """return queryset. filter queryset to include only 
         active product for normal users. Admins get full product list
-        including products in draft and archive"""
-        if IsAdminUser().has_permission(self.request, None):
-            self.queryset = Product.objects.all()
-        return self.queryset
+        including products in draft and archive.
+        The rating summary and the related objects rendered by the
+        serializer are loaded along with the products, so the number of
+        queries does not grow with the number of products returned."""
+        queryset = self.queryset
+        if self.is_admin():
+            queryset = Product.objects.all()
+        return queryset.select_related("rating_summary").prefetch_related(
+            "categories", "tags", "images"
+        )
+
+    def is_admin(self):
+        return IsAdminUser().has_permission(self.request, None)
+
+    def get_cache_params(self, **params):
+        """the request data the cached responses vary on"""
+        params.update(self.request.query_params.items())
+        params["host"] = self.request.get_host() # pagination links are absolute urls
+        return params
+
+    def get_admin_etag(self):
+        """ETag of the products admins see, which are not cached. Every change
+        rendered on a product (e.g its categories, tags or images) bumps the
+        catalog version, so the ETag costs no query"""
+        return make_etag("admin", get_catalog_version(), self.request.get_full_path())
 
     def list(self, request, *args, **kwargs):
+        """the list is cached until the catalog changes, or until
+        one of the categories it is filtered by changes. The cache key
+        doubles as the ETag, so conditional requests cost no query.
+        Admins always get a fresh response"""
+        if self.is_admin():
+            return conditional_response(
+                request, lambda: self._list(request, *args, **kwargs), self.get_admin_etag(), private=True
+            )
+        categories = [i.strip() for i in request.query_params.get("category", "").split(",") if i.strip()]
+        scopes = [f"category:{name}" for name in sorted(categories)] or ["catalog"]
+        key = make_cache_key("products:list", self.get_cache_params(), scopes)
+        return conditional_response(
+            request,
+            lambda: cached_response(key, lambda: self._list(request, *args, **kwargs)),
+            etag=make_etag(key),
+        )
+
+    def _list(self, request, *args, **kwargs):
         response = super().list(request, *args, **kwargs)
         return customize_response(response, "Products retrieved successfully.")
 
+    def search(self, request, *args, **kwargs):
+        """full text search on the products, best match first"""
+        serializer = ProductSearchQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        results = search_products(serializer.validated_data["q"], serializer.validated_data["limit"])
+        product_ids = [product_id for product_id, _ in results]
+        products = self.get_queryset().in_bulk(product_ids)
+        products = [products[i] for i in product_ids if i in products]
+        data = self.get_serializer(products, many=True).data
+        return success_response(data, "Products retrieved successfully.")
+
+    def facets(self, request, *args, **kwargs):
+        """count the active products matching the filters per category,
+        tag, type and price range"""
+        queryset = self.filter_queryset(
+            Product.objects.filter(status=Product.ProductStatus.active)
+        )
+        params = {
+            key: request.query_params[key]
+            for key in ProductFilter.base_filters if key in request.query_params
+        }
+        data = get_facets(queryset, params)
+        return success_response(data, "Product facets retrieved successfully.")
+
     def create(self, request, *args, **kwargs):
         response = super().create(request, *args, **kwargs)
         return customize_response(response, "Product created successfully.")
 
     def retrieve(self, request, *args, **kwargs):
+        """the product is cached until it changes, the cache key
+        is used as ETag. Admins always get a fresh response"""
+        pk = kwargs[self.lookup_field]
+        if self.is_admin():
+            return conditional_response(
+                request, lambda: self._retrieve(request, *args, **kwargs), self.get_admin_etag(), private=True
+            )
+        key = make_cache_key("products:detail", self.get_cache_params(pk=pk), [f"product:{pk}"])
+        return conditional_response(
+            request,
+            lambda: cached_response(key, lambda: self._retrieve(request, *args, **kwargs)),
+            etag=make_etag(key),
+        )
+
+    def _retrieve(self, request, *args, **kwargs):
         response = super().retrieve(request, *args, **kwargs)
         return customize_response(response, "Product retrieved successfully.")
 
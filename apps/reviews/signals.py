@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from apps.products.cache import invalidate_products
+from .models import Review
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_product_on_review_change(sender, instance, **kwargs):
+    """the rating of a product is rendered in the cached catalog responses"""
+    invalidate_products([instance.product_id])
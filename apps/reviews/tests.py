@@ -1,3 +1,74 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.urls import reverse_lazy
+from rest_framework import status
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from apps.accounts.models import User
+from apps.products.models import Product, ProductRating
+from .models import Review
+
+
+@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+class ReviewRatingSummaryTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = User.objects.create_user(
+            email="testemail@gmail.com",
+            password="testpassword",
+            first_name="test",
+            last_name="user",
+        )
+        cls.product = Product.objects.create(
+            name="product", description="description", price=1000, stock_quantity=10
+        )
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def get_summary(self):
+        return ProductRating.objects.get(product=self.product)
+
+    def test_create_review(self):
+        url = reverse_lazy("review-list")
+        response = self.client.post(url, {"product": self.product.pk, "rating": 4}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        summary = self.get_summary()
+        self.assertEqual(summary.rating_count, 1)
+        self.assertEqual(summary.rating_sum, 4)
+        self.assertEqual(summary.four_star_count, 1)
+
+    def test_update_review(self):
+        review = Review.objects.create(product=self.product, user=self.user, rating=2)
+        ProductRating.rebuild()
+        url = reverse_lazy("review-detail", kwargs={"pk": review.pk})
+        response = self.client.patch(url, {"rating": 5}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        summary = self.get_summary()
+        self.assertEqual(summary.rating_count, 1)
+        self.assertEqual(summary.rating_sum, 5)
+        self.assertEqual(summary.histogram, {1: 0, 2: 0, 3: 0, 4: 0, 5: 1})
+
+    def test_delete_review(self):
+        review = Review.objects.create(product=self.product, user=self.user, rating=3)
+        ProductRating.rebuild()
+        url = reverse_lazy("review-detail", kwargs={"pk": review.pk})
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        summary = self.get_summary()
+        self.assertEqual(summary.rating_count, 0)
+        self.assertEqual(summary.rating_sum, 0)
+        self.assertEqual(summary.three_star_count, 0)
+
+    def test_list_not_modified(self):
+        review = Review.objects.create(product=self.product, user=self.user, rating=3)
+        ProductRating.rebuild()
+        url = reverse_lazy("review-list")
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.client.patch(
+            reverse_lazy("review-detail", kwargs={"pk": review.pk}), {"rating": 5}, format="json"
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -1,8 +1,11 @@
+from django.db import transaction
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.permissions import IsAdminUser, IsAuthenticatedOrReadOnly
 
+from common.utils.conditional import conditional_response, queryset_validators
 from common.utils.responses import customize_response
 from apps.accounts.permissions import IsOwnerOrReadonly
+from apps.products.models import ProductRating
 
 from .models import Review
 from .serializers import ReviewSerializer, ReviewQuerySerializer
@@ -23,7 +26,37 @@ class ReviewViewSet(ModelViewSet):
             return self.queryset.filter(product_id=product_id)
         return super().get_queryset()
 
+    def perform_create(self, serializer):
+        """save the review and add its rating to the product rating summary"""
+        with transaction.atomic():
+            review = serializer.save()
+            ProductRating.record(review.product_id, added=review.rating)
+
+    def perform_update(self, serializer):
+        """save the review and move its rating in the product rating summary"""
+        previous_rating = serializer.instance.rating
+        with transaction.atomic():
+            review = serializer.save()
+            if review.rating != previous_rating:
+                ProductRating.record(review.product_id, added=review.rating, removed=previous_rating)
+
+    def perform_destroy(self, instance):
+        """delete the review and remove its rating from the product rating summary"""
+        with transaction.atomic():
+            instance.delete()
+            ProductRating.record(instance.product_id, removed=instance.rating)
+
     def list(self, request, *args, **kwargs):
+        """only the ETag is sent, a deleted review does not change the
+        latest update date of the list"""
+        etag, _ = queryset_validators(
+            self.get_queryset(), extra=[request.get_full_path()]
+        )
+        return conditional_response(
+            request, lambda: self._list(request, *args, **kwargs), etag
+        )
+
+    def _list(self, request, *args, **kwargs):
         response = super().list(request, *args, **kwargs)
         return customize_response(response, "Reviews retrieved successfully.")
 
@@ -32,6 +65,14 @@ class ReviewViewSet(ModelViewSet):
         return customize_response(response, "Review created successfully.")
 
     def retrieve(self, request, *args, **kwargs):
+        etag, last_modified = queryset_validators(
+            self.get_queryset().filter(pk=kwargs[self.lookup_field]), extra=[request.get_full_path()]
+        )
+        return conditional_response(
+            request, lambda: self._retrieve(request, *args, **kwargs), etag, last_modified
+        )
+
+    def _retrieve(self, request, *args, **kwargs):
         response = super().retrieve(request, *args, **kwargs)
         return customize_response(response, "Review retrieved successfully.")
 
@@ -0,0 +1,82 @@
+"""
+Read-your-writes consistency with read replicas.
+
+Replicas lag behind the primary database, so a customer who just changed
+something (added to their cart, placed an order, posted a review) could
+read the previous state from a replica on the next request. After a write
+request, the reads of the customer are pinned to the primary database for
+`READ_YOUR_WRITES_WINDOW` seconds. The pin is a cookie, for clients that keep
+cookies, and a cache key per user, for the ones authenticated with a token.
+The reads of every request can be pinned too (`pin_all_reads`), e.g after a
+change that invalidates data cached for every customer: the new data must not
+be read from (and cached from) a replica that does not have the change yet.
+`ReplicaRouter` asks `is_pinned` before reading from a replica.
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+PIN_COOKIE = "db_pin"
+PIN_ALL_CACHE_KEY = "db:pin:all"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+_current_request = ContextVar("db_pin_request", default=None)
+
+
+def pin_cache_key(user_pk):
+    return f"db:pin:{user_pk}"
+
+
+def is_pinned() -> bool:
+    """whether the reads of the current request must go to the primary database"""
+    request = _current_request.get()
+    if request is None:
+        return False
+    if request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES:
+        return True
+    if _has_pin(request, PIN_ALL_CACHE_KEY):
+        return True
+    # the user is only known once the view authenticated the request
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return False
+    return _has_pin(request, pin_cache_key(user.pk))
+
+
+def _has_pin(request, key) -> bool:
+    """whether the pin `key` is set, looked up once per request"""
+    pins = request.__dict__.setdefault("_db_pins", {})
+    if key not in pins:
+        pins[key] = bool(cache.get(key))
+    return pins[key]
+
+
+def pin_all_reads():
+    """pin the reads of every request to the primary database for
+    `READ_YOUR_WRITES_WINDOW` seconds"""
+    cache.set(PIN_ALL_CACHE_KEY, True, settings.READ_YOUR_WRITES_WINDOW)
+
+
+class ReadYourWritesMiddleware:
+    """pin the reads of a user to the primary database after they write"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _current_request.set(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            self.pin(request, response)
+        return response
+
+    def pin(self, request, response):
+        window = settings.READ_YOUR_WRITES_WINDOW
+        response.set_cookie(PIN_COOKIE, "1", max_age=window, httponly=True, samesite="Lax")
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            cache.set(pin_cache_key(user.pk), True, window)
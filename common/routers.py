@@ -0,0 +1,38 @@
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from common.middleware import is_pinned
+
+
+class ReplicaRouter:
+    """
+    Send the reads of the catalog (the apps in `REPLICA_READ_APPS`) to a
+    random database of `DATABASE_REPLICAS`, everything else (carts, orders,
+    payments and every write) goes to the primary database.
+
+    Reads made in a transaction of the primary stay on the primary, they may
+    depend on its uncommitted changes (e.g the product stock while placing
+    an order). So do the reads of a user who just wrote something, until
+    the replicas caught up (see `common.middleware`), anonymous catalog
+    traffic uses the replicas. Replicas are copies of the primary, so
+    relations are allowed between all databases and migrations only run on
+    the primary.
+    """
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or model._meta.app_label not in settings.REPLICA_READ_APPS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block or is_pinned():
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
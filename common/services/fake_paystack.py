@@ -0,0 +1,238 @@
+"""
+A local stand-in for the Paystack API, to run integration and load tests
+of the payment flow without reaching `api.paystack.co`.
+
+It implements the endpoints used by `payment_service`:
+
+- `POST /transaction/initialize`
+- `GET /transaction/verify/<reference>`
+
+and marks transactions as paid after a delay (or when `pay` is called or
+their `authorization_url` is opened), sending a signed `charge.success`
+webhook to `webhook_url` like Paystack does. Latency, error rate and
+timeouts can be configured to exercise failure handling.
+Point the app to it with the `PAYSTACK_BASE_URL` setting
+(or `payment_service.set_client`) and run it with the `fake_paystack`
+command, or start it from a test:
+
+    server = FakePaystackServer(secret_key="secret").start()
+    ...
+    server.stop()
+"""
+import hashlib
+import hmac
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+VERIFY_PATH_RE = re.compile(r"^/transaction/verify/(?P<reference>[^/?]+)$")
+PAY_PATH_RE = re.compile(r"^/pay/(?P<access_code>[^/?]+)$")
+
+
+def sign(secret_key: str, body: bytes):
+    """the signature Paystack sends in the `X-Paystack-Signature` header"""
+    return hmac.new(secret_key.encode("utf-8"), body, hashlib.sha512).hexdigest()
+
+
+class FakePaystackHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakePaystackServer"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if self.path.split("?")[0] != "/transaction/initialize":
+            return self.send_json(404, {"status": False, "message": "Not found"})
+        if self.simulate_failure():
+            return
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError:
+            return self.send_json(400, {"status": False, "message": "Invalid JSON"})
+        if not data.get("email") or not data.get("amount"):
+            return self.send_json(400, {"status": False, "message": "email and amount are required"})
+        transaction = self.server.create_transaction(data)
+        self.send_json(200, {
+            "status": True,
+            "message": "Authorization URL created",
+            "data": {
+                "authorization_url": f"{self.server.url}/pay/{transaction['access_code']}",
+                "access_code": transaction["access_code"],
+                "reference": transaction["reference"],
+            },
+        })
+
+    def do_GET(self):
+        match = PAY_PATH_RE.match(self.path)
+        if match:
+            """the checkout page (authorization_url): paying is simulated by opening it"""
+            transaction = self.server.find_transaction(access_code=match["access_code"])
+            if transaction is None:
+                return self.send_json(404, {"status": False, "message": "Not found"})
+            self.server.pay(transaction["reference"])
+            return self.send_json(200, {"status": True, "message": "Payment successful"})
+        match = VERIFY_PATH_RE.match(self.path)
+        if not match:
+            return self.send_json(404, {"status": False, "message": "Not found"})
+        if self.simulate_failure():
+            return
+        transaction = self.server.transactions.get(match["reference"])
+        if transaction is None:
+            return self.send_json(400, {"status": False, "message": "Transaction reference not found"})
+        self.send_json(200, {"status": True, "message": "Verification successful", "data": transaction})
+
+    def simulate_failure(self):
+        """check the key, then apply the configured latency, timeouts
+        and errors. Returns True when the request was answered"""
+        if self.headers.get("Authorization") != f"Bearer {self.server.secret_key}":
+            self.send_json(401, {"status": False, "message": "Invalid key"})
+            return True
+        server = self.server
+        time.sleep(server.latency + server.random.uniform(0, server.jitter))
+        if server.random.random() < server.timeout_rate:
+            time.sleep(server.hang)
+        if server.random.random() < server.error_rate:
+            self.send_json(500, {"status": False, "message": "An error occurred"})
+            return True
+        return False
+
+    def send_json(self, status_code: int, data: dict):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class FakePaystackServer(ThreadingHTTPServer):
+    """
+    The fake Paystack server. Transactions are kept in memory.
+    `latency` (+ up to `jitter`) seconds are added to every request,
+    `timeout_rate` of the requests hang for `hang` seconds and `error_rate`
+    of them fail with a 500. Transactions are paid `pay_after` seconds after
+    they are initialized (never if None), then a webhook is sent to
+    `webhook_url` if set. `seed` makes the failures reproducible.
+    """
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 0),
+        secret_key="",
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        timeout_rate=0.0,
+        hang=30.0,
+        pay_after=None,
+        webhook_url=None,
+        seed=None,
+    ):
+        super().__init__(address, FakePaystackHandler)
+        self.secret_key = secret_key
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self.pay_after = pay_after
+        self.webhook_url = webhook_url
+        self.random = random.Random(seed)
+        self.transactions = {}
+        self.transaction_count = 0
+        self.webhooks_sent = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """serve in a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def create_transaction(self, data: dict):
+        reference = data.get("reference") or uuid.uuid4().hex[:12]
+        transaction = {
+            "reference": reference,
+            "access_code": uuid.uuid4().hex[:15],
+            "amount": int(data["amount"]),
+            "currency": data.get("currency", "NGN"),
+            "status": "abandoned",
+            "paid_at": None,
+            "channel": "card",
+            "gateway_response": "The transaction was not completed",
+            "customer": {"email": data["email"]},
+            "metadata": data.get("metadata"),
+        }
+        with self._lock:
+            self.transaction_count += 1
+            transaction["id"] = self.transaction_count
+            self.transactions[reference] = transaction
+        if self.pay_after is not None:
+            timer = threading.Timer(self.pay_after, self.pay, args=[reference])
+            timer.daemon = True
+            timer.start()
+        return transaction
+
+    def find_transaction(self, access_code: str):
+        with self._lock:
+            for transaction in self.transactions.values():
+                if transaction["access_code"] == access_code:
+                    return transaction
+        return None
+
+    def pay(self, reference: str):
+        """mark a transaction as paid and send its webhook"""
+        with self._lock:
+            transaction = self.transactions[reference]
+            transaction.update({
+                "status": "success",
+                "paid_at": timezone.now().isoformat(),
+                "gateway_response": "Successful",
+            })
+        if self.webhook_url:
+            self.send_webhook(reference)
+        return transaction
+
+    def webhook(self, reference: str, event="charge.success"):
+        """return the body and headers of the webhook of a transaction"""
+        body = json.dumps({"event": event, "data": self.transactions[reference]}).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json",
+            "X-Paystack-Signature": sign(self.secret_key, body),
+        }
+        return body, headers
+
+    def send_webhook(self, reference: str, event="charge.success"):
+        body, headers = self.webhook(reference, event)
+        try:
+            response = requests.post(self.webhook_url, data=body, headers=headers, timeout=10)
+            logger.info("Webhook %s for %s: %s", event, reference, response.status_code)
+        except requests.RequestException as e:
+            logger.warning("Webhook %s for %s failed: %s", event, reference, e)
+            return
+        with self._lock:
+            self.webhooks_sent += 1
@@ -1,23 +1,118 @@
 import logging
+import threading
+
 import requests
-from requests.exceptions import Timeout, HTTPError
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout, HTTPError
+from urllib3.util.retry import Retry
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 
 from common.utils.custom_exceptions import ServiceUnavailable
 
 logger = logging.getLogger(__name__)
 
 PAYSTACK_URL = {
-    "init_payment": "https://api.paystack.co/transaction/initialize",
-    "verify_payment": "https://api.paystack.co/transaction/verify/{reference}"
+    "init_payment": "/transaction/initialize",
+    "verify_payment": "/transaction/verify/{reference}"
 }
 
-HEADERS = {
-    "Authorization": f"Bearer {settings.PAYSTACK_KEY}",
-    "content-type": "application/json",
-}
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class PaystackClient:
+    """
+    Client for the Paystack API. Requests go through a shared session, so
+    connections are kept alive and reused instead of paying a new TCP and TLS
+    handshake on every call. Requests are retried with backoff on connection
+    errors (the request never reached the gateway), idempotent ones (GET)
+    also on read errors and on 429/5xx responses.
+    """
+    def __init__(
+        self,
+        secret_key: str,
+        base_url="https://api.paystack.co",
+        pool_size=10,
+        connect_timeout=3.05,
+        read_timeout=20,
+        max_retries=2,
+        backoff_factor=0.3,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {secret_key}",
+            "content-type": "application/json",
+        })
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            secret_key=settings.PAYSTACK_KEY,
+            base_url=settings.PAYSTACK_BASE_URL,
+            pool_size=settings.PAYSTACK_POOL_SIZE,
+            connect_timeout=settings.PAYSTACK_CONNECT_TIMEOUT,
+            read_timeout=settings.PAYSTACK_READ_TIMEOUT,
+            max_retries=settings.PAYSTACK_MAX_RETRIES,
+        )
+
+    def request(self, method: str, path: str, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, f"{self.base_url}{path}", **kwargs)
+
+    def initialize_transaction(self, data: dict):
+        return self.request("POST", PAYSTACK_URL["init_payment"], json=data)
+
+    def verify_transaction(self, reference: str):
+        return self.request("GET", PAYSTACK_URL["verify_payment"].format(reference=reference))
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> PaystackClient:
+    """return the client shared by the process, created from the settings"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PaystackClient.from_settings()
+    return _client
+
+
+def set_client(client: PaystackClient | None):
+    """replace the shared client (e.g with one pointing to a fake Paystack
+    server). The next call to `get_client` creates one from the settings
+    again when `client` is None"""
+    global _client
+    with _client_lock:
+        previous, _client = _client, client
+    if previous is not None and previous is not client:
+        previous.close()
+
+
+@receiver(setting_changed)
+def reset_client(setting, **kwargs):
+    """rebuild the client when the paystack settings are overridden (tests)"""
+    if setting.startswith("PAYSTACK_"):
+        set_client(None)
 
-TIMEOUT = 20 # timeout in seconds
 
 def initialize_payment(data: dict):
     """initialize a payment and return the redirect url"""
@@ -32,15 +127,19 @@ def initialize_payment(data: dict):
     amount = data["amount"]
     data["amount"] *= 100 # convert to subunit (Paystack expects amount in subunit)
     order_id = data.pop("order_id")
+    client = get_client()
     try:
-        response = requests.post(PAYSTACK_URL["init_payment"], json=data, headers=HEADERS, timeout=TIMEOUT)
+        response = client.initialize_transaction(data)
         response.raise_for_status()
     except HTTPError:
         logger.error("HTTP error while initializing payment to Paystack\nStatus Code:%s\n\nResponse data:\n%s",
                      response.status_code, response.text)
         raise ServiceUnavailable("Unable to initialize payment, try again. Please contact support if issue persists")
     except Timeout:
-        logger.error("Timeout error while initializing payment. Timeout after %s min", TIMEOUT)
+        logger.error("Timeout error while initializing payment. Timeout after %s sec", client.timeout)
+        raise ServiceUnavailable("Unable to initialize payment, try again. Please contact support if issue persists")
+    except ConnectionError as e:
+        logger.error("Connection error while initializing payment: %s", e)
         raise ServiceUnavailable("Unable to initialize payment, try again. Please contact support if issue persists")
 
     res_data = response.json()
@@ -61,8 +160,9 @@ def initialize_payment(data: dict):
 
 def verify_payment(reference):
     """verify the status of a payment"""
+    client = get_client()
     try:
-        response = requests.get(PAYSTACK_URL["verify_payment"].format(reference=reference), headers=HEADERS, timeout=TIMEOUT)
+        response = client.verify_transaction(reference)
         response.raise_for_status()
         return response.json()
     except HTTPError:
@@ -70,6 +170,8 @@ def verify_payment(reference):
                      response.status_code, response.text)
         raise ServiceUnavailable("Unable to verifying payment, try again. Please contact support if issue persists")
     except Timeout:
-        logger.error("Timeout error while verifying payment. Timeout after %s min", TIMEOUT)
+        logger.error("Timeout error while verifying payment. Timeout after %s sec", client.timeout)
+        raise ServiceUnavailable("Unable to verifying payment, try again. Please contact support if issue persists")
+    except ConnectionError as e:
+        logger.error("Connection error while verifying payment: %s", e)
         raise ServiceUnavailable("Unable to verifying payment, try again. Please contact support if issue persists")
-
@@ -0,0 +1,103 @@
+from types import SimpleNamespace
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from apps.cart.models import Cart
+from apps.products.cache import bump_versions
+from apps.products.models import Product
+from apps.reviews.models import Review
+from .middleware import PIN_ALL_CACHE_KEY, PIN_COOKIE, ReadYourWritesMiddleware, pin_cache_key
+from .routers import ReplicaRouter
+from .utils.database import database_config
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"])
+class ReplicaRouterTest(SimpleTestCase):
+    databases = {"default"}
+
+    def test_catalog_reads_go_to_replicas(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Product), "replica_1")
+        self.assertEqual(router.db_for_read(Review), "replica_1")
+        self.assertEqual(router.db_for_read(Cart), "default")
+        self.assertEqual(router.db_for_write(Product), "default")
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Product), "default")
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        self.assertEqual(ReplicaRouter().db_for_read(Product), "default")
+
+    def test_database_config(self):
+        config = database_config("postgres://shop:p%40ss@db:5432/eshop?sslmode=require", conn_max_age=60)
+        self.assertEqual(config["ENGINE"], "django.db.backends.postgresql")
+        self.assertEqual(
+            (config["NAME"], config["USER"], config["PASSWORD"], config["HOST"], config["PORT"]),
+            ("eshop", "shop", "p@ss", "db", "5432"),
+        )
+        self.assertEqual((config["CONN_MAX_AGE"], config["OPTIONS"]), (60, {"sslmode": "require"}))
+
+        config = database_config("sqlite:////var/lib/eshop/db.sqlite3")
+        self.assertEqual(config["NAME"], "/var/lib/eshop/db.sqlite3")
+        self.assertIn("journal_mode=WAL", config["OPTIONS"]["init_command"])
+        with self.assertRaises(ValueError):
+            database_config("oracle://db/eshop")
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"], READ_YOUR_WRITES_WINDOW=10)
+class ReadYourWritesTest(SimpleTestCase):
+    databases = {"default"}
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.factory = RequestFactory()
+        self.user = SimpleNamespace(pk=1, is_authenticated=True)
+
+    def request(self, method="get", user=None, cookies=None):
+        """run a request through the middleware, returns the response and
+        the database the products were read from in the view"""
+        request = getattr(self.factory, method)("/")
+        request.COOKIES.update(cookies or {})
+        read_from = []
+
+        def view(request):
+            if user is not None:
+                request.user = user # authenticated by the view, like DRF does
+            read_from.append(ReplicaRouter().db_for_read(Product))
+            return HttpResponse(status=201 if method == "post" else 200)
+
+        response = ReadYourWritesMiddleware(view)(request)
+        return response, read_from[0]
+
+    def test_anonymous_reads_use_replicas(self):
+        response, db = self.request()
+        self.assertEqual(db, "replica_1")
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_reads_pinned_after_write(self):
+        response, db = self.request("post", user=self.user)
+        self.assertEqual(db, "default")
+        self.assertEqual(response.cookies[PIN_COOKIE]["max-age"], 10)
+        self.assertTrue(cache.get(pin_cache_key(self.user.pk)))
+
+        # by cookie, or by user for clients without cookies
+        self.assertEqual(self.request(cookies={PIN_COOKIE: "1"})[1], "default")
+        self.assertEqual(self.request(user=self.user)[1], "default")
+        other = SimpleNamespace(pk=2, is_authenticated=True)
+        self.assertEqual(self.request(user=other)[1], "replica_1")
+
+        cache.delete(pin_cache_key(self.user.pk))
+        self.assertEqual(self.request(user=self.user)[1], "replica_1")
+
+    def test_reads_pinned_after_catalog_change(self):
+        """the data cached under the new catalog version is not read from a
+        replica that may not have the change yet"""
+        bump_versions("catalog") # outside a transaction, bumped right away
+        self.assertEqual(self.request()[1], "default")
+        self.assertEqual(self.request(user=self.user)[1], "default")
+
+        cache.delete(PIN_ALL_CACHE_KEY)
+        self.assertEqual(self.request()[1], "replica_1")
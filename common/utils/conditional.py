@@ -0,0 +1,72 @@
+"""
+Conditional GET support (`ETag`/`Last-Modified` with `If-None-Match`/
+`If-Modified-Since`). The validators are computed before the response is
+built, usually from a single aggregate query, so an unchanged resource is
+answered with a `304 Not Modified` without loading or serializing it.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def make_etag(*parts):
+    """build a quoted ETag from the parts that identify a representation"""
+    value = "|".join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(value.encode("utf-8")).hexdigest())
+
+
+def queryset_validators(queryset, fields=("updated_at",), extra=()):
+    """
+    Compute the validators of a queryset in one aggregate query: the ETag
+    changes when a row is added, removed or updated (count and latest
+    value of each datetime field), `Last-Modified` is the latest of them.
+    `fields` can span relations to include the rows rendered along with
+    the queryset. `extra` is added to the ETag.
+    Removing a row does not move `Last-Modified`, so lists must only send
+    the ETag, `Last-Modified` is for a single object.
+    """
+    aggregates = {f"latest_{i}": Max(field) for i, field in enumerate(fields)}
+    result = queryset.order_by().aggregate(count=Count("pk", distinct=True), **aggregates)
+    latest = [result[key] for key in aggregates]
+    etag = make_etag(result["count"], *[i.isoformat() if i else "" for i in latest], *extra)
+    last_modified = max((i for i in latest if i), default=None)
+    return etag, int(last_modified.timestamp()) if last_modified else None
+
+
+def is_not_modified(request, etag=None, last_modified=None):
+    """check the request preconditions against the validators"""
+    if request.method not in ("GET", "HEAD"):
+        return False
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match:
+        if etag is None:
+            return False
+        etags = parse_etags(if_none_match)
+        return "*" in etags or etag.removeprefix("W/") in [i.removeprefix("W/") for i in etags]
+    if_modified_since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE", ""))
+    return bool(last_modified and if_modified_since and last_modified <= if_modified_since)
+
+
+def conditional_response(request, build_response, etag=None, last_modified=None, private=False):
+    """
+    Return a `304 Not Modified` if the client has the current representation,
+    else the response returned by `build_response`. Successful responses
+    carry the validators so the client can send them on the next request.
+    `private` marks responses specific to the user.
+    """
+    if is_not_modified(request, etag, last_modified):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = build_response()
+    if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+        if etag:
+            response.headers["ETag"] = etag
+        if last_modified:
+            response.headers["Last-Modified"] = http_date(last_modified)
+        visibility = {"private": True} if private else {"public": True}
+        patch_cache_control(response, no_cache=True, **visibility)
+    return response
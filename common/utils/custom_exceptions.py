@@ -32,3 +32,17 @@ class UniqueOrderNumberError(APIException):
     status = status.HTTP_500_INTERNAL_SERVER_ERROR
     default_detail = "Error while generating unique order number"
     default_code = "Unique Order Number Error"
+
+
+class PaymentInProgress(APIException):
+    """Error when the payment of an order is being initialized by another request"""
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The payment of this order is already being initialized"
+    default_code = "Payment In Progress"
+
+
+class PaymentAlreadyInitialized(APIException):
+    """Error when the payment of an order was already initialized"""
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Payment already initialized for this order."
+    default_code = "Payment Already Initialized"
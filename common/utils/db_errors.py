@@ -0,0 +1,90 @@
+"""
+Classification of database errors, independent of the database backend.
+
+Django raises the same `IntegrityError` for every constraint on every
+backend, the constraint that failed is only found in the error of the
+database driver (`__cause__`): an error code (SQLSTATE on PostgreSQL,
+errno on MySQL, extended result code on SQLite) and the name of the
+constraint or the columns in its message.
+"""
+import re
+from dataclasses import dataclass
+
+from django.db import IntegrityError
+
+PG_UNIQUE_VIOLATION = "23505"
+MYSQL_DUP_ENTRY = 1062
+SQLITE_CONSTRAINT_PRIMARYKEY = 1555
+SQLITE_CONSTRAINT_UNIQUE = 2067
+
+PG_DETAIL_RE = re.compile(r"Key \((?P<columns>[^)]*)\)=")
+MYSQL_KEY_RE = re.compile(r"for key '(?P<key>[^']*)'")
+SQLITE_UNIQUE_RE = re.compile(r"^UNIQUE constraint failed: (?P<columns>.+)$")
+
+
+@dataclass(frozen=True)
+class UniqueViolation:
+    """a unique constraint that failed, with its name and/or its columns
+    when the backend reports them"""
+    constraint: str = ""
+    columns: tuple[str, ...] = ()
+
+    def matches(self, model, *fields: str) -> bool:
+        """whether it is the unique constraint of `fields` of `model`"""
+        table = model._meta.db_table
+        columns = {model._meta.get_field(field).column for field in fields}
+        if self.columns:
+            if any(c.rpartition(".")[0] not in ("", table) for c in self.columns):
+                return False # SQLite reports `table.column`
+            return {c.rpartition(".")[2] for c in self.columns} == columns
+        constraint = self.constraint.split(".")[-1] # MySQL 8 reports `table.key`
+        names = {
+            c.name for c in model._meta.constraints
+            if {model._meta.get_field(f).column for f in getattr(c, "fields", ())} == columns
+        }
+        if len(columns) == 1:
+            column = next(iter(columns))
+            # the default names of a `unique=True` column: `<table>_<column>_key`
+            # (PostgreSQL), `<table>_<column>_<hash>_uniq` (django) or `<column>` (MySQL)
+            names |= {f"{table}_{column}_key", column}
+            if constraint.startswith(f"{table}_{column}_") and constraint.endswith("_uniq"):
+                return True
+        return constraint in names
+
+
+def unique_violation(error: Exception) -> UniqueViolation | None:
+    """return the unique constraint that failed when `error` is a unique
+    violation, None otherwise"""
+    if not isinstance(error, IntegrityError):
+        return None
+    cause = error.__cause__ or error
+
+    sqlstate = getattr(cause, "sqlstate", None) or getattr(cause, "pgcode", None)
+    if sqlstate is not None:
+        if sqlstate != PG_UNIQUE_VIOLATION:
+            return None
+        diag = getattr(cause, "diag", None)
+        detail = PG_DETAIL_RE.search(getattr(diag, "message_detail", None) or "")
+        return UniqueViolation(
+            constraint=getattr(diag, "constraint_name", None) or "",
+            columns=tuple(c.strip() for c in detail["columns"].split(",")) if detail else (),
+        )
+
+    sqlite_code = getattr(cause, "sqlite_errorcode", None)
+    match = SQLITE_UNIQUE_RE.match(str(cause))
+    if sqlite_code in (SQLITE_CONSTRAINT_UNIQUE, SQLITE_CONSTRAINT_PRIMARYKEY) or match:
+        if not match:
+            return UniqueViolation()
+        return UniqueViolation(columns=tuple(c.strip() for c in match["columns"].split(",")))
+
+    args = getattr(cause, "args", ())
+    if args and args[0] == MYSQL_DUP_ENTRY:
+        key = MYSQL_KEY_RE.search(str(args[-1]))
+        return UniqueViolation(constraint=key["key"] if key else "")
+    return None
+
+
+def is_unique_violation(error: Exception, model, *fields: str) -> bool:
+    """whether `error` is the violation of the unique constraint of `fields` of `model`"""
+    violation = unique_violation(error)
+    return violation is not None and violation.matches(model, *fields)
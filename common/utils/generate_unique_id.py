@@ -1,31 +1,91 @@
-import uuid
+import os
+import random
+import threading
+import time
+
 from sqids import Sqids
-from django.utils import timezone
+from django.conf import settings
 
+ALPHABET = "ABCDEFGHIJKLMNPRSTUVWXYZ1234567890"
+EPOCH = 1735689600
+"""2025-01-01 00:00 UTC, order numbers count seconds from it"""
 
-def generate_unique_id():
+HOST_BITS = 10
+PID_BITS = 22
+SEQUENCE_BITS = 10
+
+
+class OrderNumberAllocator:
     """
-    Generate a unique user-friendly order id with the 
-    least possible chance of collision.
-    The ID will use the format `YYMMDDHHMM-<random bits>`.
-    The first part (YYMMDDHHMM) which represents the year
-    down to the minute will then be encoded using the squid
-    library, and the final part will be cut out of a regular
-    UUID4 hex string.
-    This will help reduce the amount of collision per minute a day.
+    Allocate unique user-friendly order numbers without asking the database.
+
+    An order number encodes (with sqids) three numbers:
+
+    - the second it was allocated at (since `EPOCH`)
+    - the node that allocated it: the host id and the id of the process
+    - a per process sequence, reset every second
+
+    Processes of a host have different ids, so two processes never allocate
+    the same number as long as their hosts have different ids (set with the
+    `ORDER_NUMBER_HOST_ID` setting, a random one is picked per process when
+    it is not set). A process allocates up to 1024 numbers per second, the
+    following ones are taken from the next second, and the clock never goes
+    backwards within a process, so it never repeats a number either.
     """
+    def __init__(self, host_id=None):
+        self.sqids = Sqids(min_length=4, alphabet=ALPHABET)
+        self.host_id = host_id
+        self.reset()
+
+    def reset(self):
+        """pick the node of the current process (also called in forked children)"""
+        host_id = self.host_id
+        if host_id is None:
+            host_id = random.getrandbits(HOST_BITS)
+        self.node = (host_id % (1 << HOST_BITS)) << PID_BITS | (os.getpid() % (1 << PID_BITS))
+        self.last_second = 0
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def allocate(self):
+        with self.lock:
+            second = max(int(time.time()) - EPOCH, self.last_second)
+            if second == self.last_second:
+                self.sequence += 1
+                if self.sequence >> SEQUENCE_BITS:
+                    second, self.sequence = second + 1, 0
+            else:
+                self.sequence = 0
+            self.last_second = second
+            sequence = self.sequence
+        return self.sqids.encode([second, self.node, sequence])
 
-    timestamp = timezone.now()
-    year = timestamp.strftime("%y")
-    month = timestamp.strftime("%m").lstrip("0") # remove leading 0 in a cross platform compactible way
-    other = timestamp.strftime("%d%H%M")
-    timestamp = f"{year}{month}{other}"
 
-    uuid_suffix = uuid.uuid4().hex[:6].upper()
+_allocator = None
+_allocator_lock = threading.Lock()
 
-    sqids = Sqids(min_length=4, alphabet="ABCDEFGHIJKLMNPRSTUVWXYZ1234567890")
-    half_id = sqids.encode([int(timestamp)])
-    full_id = f"{half_id.upper()}-{uuid_suffix}"
-    
-    return full_id
 
+def get_allocator() -> OrderNumberAllocator:
+    """return the allocator of the process"""
+    global _allocator
+    if _allocator is None:
+        with _allocator_lock:
+            if _allocator is None:
+                _allocator = OrderNumberAllocator(getattr(settings, "ORDER_NUMBER_HOST_ID", None))
+    return _allocator
+
+
+def _reset_after_fork():
+    if _allocator is not None:
+        _allocator.reset()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def generate_unique_id():
+    """
+    Generate a unique user-friendly order number, e.g `W638UJG6DMHFU30`.
+    See `OrderNumberAllocator`.
+    """
+    return get_allocator().allocate()
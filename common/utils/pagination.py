@@ -0,0 +1,15 @@
+from rest_framework.pagination import CursorPagination
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """
+    Keyset (cursor) pagination on `created_at`, newest first. `id` breaks
+    ties so the order is stable. Each page is fetched with a
+    `WHERE created_at < <cursor position>` query, so the cost of a page does
+    not grow with how deep into the list the client is, and no `COUNT`
+    query is needed.
+    """
+    ordering = ("-created_at", "-id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
@@ -1,74 +1,94 @@
 """
-You can use this script to simulate the use of our generate order id
-logic and see how many times a collision occurs when a certain quantity
-of order is placed in the same minute.
-A retry policy is also set, so a collision will not be recorded unless 
-the max retry limit exceeds and the collision still persist for that mins.
-If you want to see what happens when no retry is happening at all (under
-a no retry policy) you can set the default value for the function argument
-`max_retries` to 1.
-I recommend using a max_retry of 5 if the order quantity is expected to
-exceed 5 in a single minute.
+You can use this script to benchmark the generation of order numbers and
+see how many collisions occur when many orders are placed at the same time
+by several processes (like the workers of the app server):
+
+    python -m common.utils.simulation --processes 8 --count 100000
+
+Each process generates `count` order numbers as fast as it can, then the
+number of order numbers generated per second and the number of duplicates
+(collisions) are reported for:
+
+- `legacy`: the previous generator, a new sqids encoder per order number
+  and a random suffix, which needed retries when the suffix collided
+- `allocator`: `OrderNumberAllocator`, a single encoder per process and no
+  random part
 """
+import argparse
+import time
 import uuid
-from datetime import datetime
-import sqids
+from collections import Counter
+from datetime import datetime, timezone
+from multiprocessing import get_context
 
+from sqids import Sqids
 
-def generate_order_id(ts: datetime, sqids_encoder, max_retries=1):
-    """
-    Generate a unique order ID:
-    - Encode timestamp with SQIDs
-    - Append 6 chars from a UUID
-    - Retry if collision
-    """
-    # Format timestamp
-    ts_str = ts.strftime("%y%-m%d%H%M")  # e.g., '2508181430'
-    ts_num = int(ts_str)
+from common.utils.generate_unique_id import ALPHABET, OrderNumberAllocator
 
-    for attempt in range(max_retries):
-        # Encode timestamp with SQIDs
-        encoded_ts = sqids_encoder.encode([ts_num]).upper()
 
-        # Take 6 chars from a UUID
-        uuid_suffix = uuid.uuid4().hex[:6].upper()
+def legacy_order_id():
+    """the order number generator used before `OrderNumberAllocator`"""
+    timestamp = datetime.now(timezone.utc)
+    year = timestamp.strftime("%y")
+    month = timestamp.strftime("%m").lstrip("0")
+    other = timestamp.strftime("%d%H%M")
+    timestamp = f"{year}{month}{other}"
 
-        # Combine
-        order_id = f"{encoded_ts}{uuid_suffix}"
+    uuid_suffix = uuid.uuid4().hex[:6].upper()
 
-        if order_id not in seen_ids:
-            seen_ids.add(order_id)
-            return order_id
+    sqids = Sqids(min_length=4, alphabet=ALPHABET)
+    half_id = sqids.encode([int(timestamp)])
+    return f"{half_id.upper()}-{uuid_suffix}"
 
-    # If still collides after retries
-    collisions.append(order_id)
-    return order_id
 
+def generate(args):
+    """generate `count` order numbers, returns them and the time it took"""
+    strategy, count, host_id = args
+    if strategy == "legacy":
+        next_id = legacy_order_id
+    else:
+        next_id = OrderNumberAllocator(host_id).allocate
+    start = time.perf_counter()
+    ids = [next_id() for _ in range(count)]
+    return ids, time.perf_counter() - start
 
-def simulate_orders_in_minute(order_count=1000, year=2025, month=8, day=18, hour=14, minute=30):
-    global seen_ids, collisions
-    seen_ids = set()
-    collisions = []
 
-    # Fix timestamp
-    ts = datetime(year, month, day, hour, minute)
+def simulate(strategy: str, processes=4, count=10000, host_id=None):
+    """generate order numbers in `processes` processes at the same time and
+    print the rate and collisions"""
+    with get_context("fork").Pool(processes) as pool:
+        start = time.perf_counter()
+        results = pool.map(generate, [(strategy, count, host_id)] * processes)
+        elapsed = time.perf_counter() - start
 
-    # SQIDs encoder
-    sqids_encoder = sqids.Sqids(
-        alphabet="ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789",
-        min_length=4  # You can tweak this
-    )
+    counts = Counter(order_id for ids, _ in results for order_id in ids)
+    total = processes * count
+    collisions = total - len(counts)
+    per_process = count / max(max(seconds for _, seconds in results), 1e-9)
+    print(f"[{strategy}] {total} order numbers in {elapsed:.2f}s by {processes} processes")
+    print(f"  {total / elapsed:,.0f} IDs/sec overall, {per_process:,.0f} IDs/sec per process")
+    print(f"  Collisions: {collisions}")
+    if collisions:
+        print("  Example collisions:", [order_id for order_id, n in counts.most_common(5) if n > 1])
+    return collisions
 
-    # Generate orders
-    for _ in range(order_count):
-        generate_order_id(ts, sqids_encoder)
 
-    print(f"Simulated {order_count} orders in {ts.strftime('%Y-%m-%d %H:%M')}")
-    print(f"Collisions after retries: {len(collisions)}")
-    if collisions:
-        print("Example collisions:", collisions[:5])
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the order number generators")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--count", type=int, default=10000, help="order numbers generated per process")
+    parser.add_argument(
+        "--strategy", choices=["legacy", "allocator", "both"], default="both",
+    )
+    parser.add_argument(
+        "--host-id", type=int, default=None,
+        help="the host id of the allocator, random per process when not set",
+    )
+    args = parser.parse_args()
+    strategies = ["legacy", "allocator"] if args.strategy == "both" else [args.strategy]
+    for strategy in strategies:
+        simulate(strategy, args.processes, args.count, args.host_id)
 
 
-# Example usage
-# simulate_orders_in_minute(order_count=1000)
-simulate_orders_in_minute(order_count=1000000)
+if __name__ == "__main__":
+    main()